@@ -1,83 +1,25 @@
-import boto3
 import os
-import requests
 import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from bs4 import BeautifulSoup
 import time
 import schedule
-import difflib
 from openai import OpenAI
 import logging
 from logging.handlers import TimedRotatingFileHandler
-from git_engine import generate_diff
+from diff_worker import compare_baseline, compare_page, get_executor, views_signature
+from extraction import boilerplate_rules
+from fetcher import iter_fetch
+from log_shipping import S3SegmentHandler
+from manifest import KEEP_VERSIONS, PRUNED_KINDS, LinkManifest, manifest_path
 from model import ChangeSummarizer
-import re
+from noise import NOISE_RULES_KEY, NoiseFilter
+from rate_limit import LLM_WORKERS, RateLimiter
+from run_state import LOGS_KEY, get_run_state
+from storage import STORAGE_TYPE, get_storage
+from translation import TRANSLATION_MEMORY, TRANSLATION_MEMORY_KEY, TRANSLATION_MEMORY_MAX_BYTES, TranslationBatcher
+from summary_cache import SUMMARY_CACHE, SummaryCache
 
-from utils import extract_ins_elements_only, extract_plain_text
-
-def remove_date_lines(html_content):
-    # Pattern to match exactly the date lines you want to remove
-    pattern = re.compile(
-        r'<del style="background-color: lightcoral;">\s*\d{4}-\d{2}-\d{2}\s*</del>\s*\n'
-        r'\s*<ins style="background-color: lightgreen;">\s*\d{4}-\d{2}-\d{2}\s*</ins>'
-    )
-    # Remove the matched pattern
-    return pattern.sub('', html_content)
-
-def remove_search_lines(html_content):
-    """
-    Remove lines containing specific search terms in either <del> or <ins> tags.
-    Targets:
-    - Search Canada.ca
-    - Search IRCC
-    - Search CRA
-    """
-    pattern = re.compile(
-        r'<(del|ins)[^>]*>\s*Search (?:Canada\.ca|IRCC|CRA)\s*</\1>',
-        re.IGNORECASE
-    )
-    return pattern.sub('', html_content)
-    
-class S3LogHandler(logging.Handler):
-    """Custom logging handler that uploads logs to S3"""
-    def __init__(self, bucket, key):
-        super().__init__()
-        self.bucket = bucket
-        self.key = key
-        self.buffer = []
-        
-    def emit(self, record):
-        try:
-            msg = self.format(record)
-            self.buffer.append(msg)
-            # Upload logs in chunks to avoid too many S3 requests
-            if len(self.buffer) >= 10:  # Upload every 10 messages
-                self.flush()
-        except Exception:
-            self.handleError(record)
-            
-    def flush(self):
-        if self.buffer and s3_client:
-            try:
-                content = "\n".join(self.buffer) + "\n"
-                # Check if log file exists
-                try:
-                    existing = s3_client.get_object(Bucket=self.bucket, Key=self.key)
-                    current_content = existing['Body'].read().decode('utf-8')
-                    content = current_content + content
-                except s3_client.exceptions.NoSuchKey:
-                    pass
-                    
-                s3_client.put_object(
-                    Bucket=self.bucket,
-                    Key=self.key,
-                    Body=content.encode('utf-8')
-                )
-                self.buffer = []
-            except Exception as e:
-                print(f"Failed to upload logs to S3: {str(e)}")
-                      
 # Set up logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -86,35 +28,33 @@ logger.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # Configuration for system logs
-SYSTEM_LOGS_KEY = "system_logs/system_logs.txt"
 LOCAL_SYSTEM_LOGS_PATH = os.path.join("system_logs", "system_logs.txt")
 LOG_RETENTION_DAYS = 3
 
 
 # Configuration
-STORAGE_TYPE = os.environ.get("STORAGE_TYPE", "s3").lower()  # Default to s3 if not set
-client = OpenAI(api_key=os.environ.get("apiKey"))
+# Retries are done by ChangeSummarizer, within the shared rate limits.
+client = OpenAI(api_key=os.environ.get("apiKey"), max_retries=0)
+llm_limiter = RateLimiter()
+
+try:
+    storage = get_storage(logger)
+except Exception as e:
+    logger.error(f"Failed to initialize {STORAGE_TYPE} storage: {str(e)}")
+    raise
 
-# Initialize S3 client only if using S3
+# The S3 backend's pooled client, also used directly by the log handler and for urls.json.
 if STORAGE_TYPE == "s3":
-    try:
-        s3_client = boto3.client('s3',
-                               aws_access_key_id=os.environ.get("AWS_ACCESS_KEY"),
-                               aws_secret_access_key=os.environ.get("AWS_SECRET_KEY"),
-                               region_name='ca-central-1')
-        s3_bucket = 'html-differentiator'
-        logger.info("Successfully initialized S3 client")
-    except Exception as e:
-        logger.error(f"Failed to initialize S3 client: {str(e)}")
-        raise
+    s3_client = storage.client
+    s3_bucket = storage.bucket
+    logger.info("Successfully initialized S3 client")
 
-LOGS_KEY = "logs/logs.json"
-LOCAL_LOGS_PATH = os.path.join("logs", "logs.json")
+VALIDATORS_KEY = "logs/validators.json"
 
 # Set up logging handlers
 if STORAGE_TYPE == "s3":
-    # Create S3 log handler
-    s3_log_handler = S3LogHandler(bucket=s3_bucket, key=SYSTEM_LOGS_KEY)
+    # Ship logs to S3 as append-only segments under system_logs/, uploaded in the background
+    s3_log_handler = S3SegmentHandler(s3_client, s3_bucket)
     s3_log_handler.setFormatter(formatter)
     logger.addHandler(s3_log_handler)
 else:
@@ -144,6 +84,9 @@ def ensure_local_storage():
         os.makedirs(os.path.join("logs"), exist_ok=True)
         os.makedirs(os.path.join("system_logs"), exist_ok=True)
         os.makedirs(os.path.join("html_runs"), exist_ok=True)
+        os.makedirs(os.path.join("html_meta"), exist_ok=True)
+        os.makedirs(os.path.join("html_views"), exist_ok=True)
+        os.makedirs(os.path.join("manifests"), exist_ok=True)
         os.makedirs(os.path.join("differences"), exist_ok=True)
         os.makedirs(os.path.join("summarys"), exist_ok=True)
         os.makedirs(os.path.join("raw_diff"), exist_ok=True)
@@ -155,254 +98,135 @@ def ensure_local_storage():
         logger.error(f"Failed to create local storage directories: {str(e)}")
         raise
 
-def save_file_locally(file_path, content):
-    """Save file to local storage."""
-    try:
-        full_path = os.path.join(file_path)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        logger.info(f"Successfully saved file locally: {full_path}")
-    except Exception as e:
-        logger.error(f"Failed to save file locally {file_path}: {str(e)}")
-        raise
-
-def read_file_locally(file_path):
-    """Read file from local storage."""
-    try:
-        full_path = os.path.join(file_path)
-        if os.path.exists(full_path):
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            logger.info(f"Successfully read local file: {full_path}")
-            return content
-        logger.warning(f"Local file not found: {full_path}")
-        return None
-    except Exception as e:
-        logger.error(f"Failed to read local file {file_path}: {str(e)}")
-        raise
-
-def list_local_files(prefix):
-    """List files in local storage matching prefix."""
-    try:
-        prefix_parts = prefix.split('/')
-        dir_path = os.path.join(*prefix_parts[:-1])
-        file_prefix = prefix_parts[-1]
-        
-        if not os.path.exists(dir_path):
-            logger.warning(f"Local directory not found: {dir_path}")
-            return []
-        
-        files = []
-        for filename in os.listdir(dir_path):
-            if filename.startswith(file_prefix):
-                full_path = os.path.join(dir_path, filename)
-                files.append({
-                    'Key': os.path.join(*prefix_parts[:-1], filename),
-                    'LastModified': datetime.fromtimestamp(os.path.getmtime(full_path))
-                })
-        
-        logger.info(f"Found {len(files)} local files matching prefix {prefix}")
-        return files
-    except Exception as e:
-        logger.error(f"Failed to list local files with prefix {prefix}: {str(e)}")
-        raise
-
-def delete_local_file(file_path):
-    """Delete file from local storage."""
-    try:
-        full_path = os.path.join(file_path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
-            logger.info(f"Successfully deleted local file: {full_path}")
-            return True
-        logger.warning(f"Local file not found for deletion: {full_path}")
-        return False
-    except Exception as e:
-        logger.error(f"Failed to delete local file {file_path}: {str(e)}")
-        raise
-
 def save_file(file_path, content):
-    """Save file to appropriate storage based on STORAGE_TYPE."""
+    """Save file to the configured storage. On S3 the upload finishes in the background; see flush_storage."""
     try:
-        if STORAGE_TYPE == "s3":
-            s3_client.put_object(Bucket=s3_bucket, Key=file_path, Body=content)
-            logger.info(f"Successfully saved file to S3: {file_path}")
-        else:
-            save_file_locally(file_path, content)
+        storage.save(file_path, content)
     except Exception as e:
         logger.error(f"Failed to save file {file_path}: {str(e)}")
         raise
 
 def read_file(file_path):
-    """Read file from appropriate storage based on STORAGE_TYPE."""
+    """Read file from the configured storage, or None if it does not exist."""
     try:
-        if STORAGE_TYPE == "s3":
-            try:
-                obj = s3_client.get_object(Bucket=s3_bucket, Key=file_path)
-                content = obj['Body'].read().decode('utf-8')
-                logger.info(f"Successfully read file from S3: {file_path}")
-                return content
-            except s3_client.exceptions.NoSuchKey:
-                logger.warning(f"S3 file not found: {file_path}")
-                return None
-        else:
-            return read_file_locally(file_path)
+        return storage.read(file_path)
     except Exception as e:
         logger.error(f"Failed to read file {file_path}: {str(e)}")
         raise
 
 def list_files(prefix):
-    """List files matching prefix in appropriate storage."""
+    """List files matching prefix in the configured storage."""
     try:
-        if STORAGE_TYPE == "s3":
-            result = s3_client.list_objects_v2(Bucket=s3_bucket, Prefix=prefix)
-            contents = result.get('Contents', [])
-            logger.info(f"Found {len(contents)} files in S3 matching prefix {prefix}")
-            return contents
-        else:
-            return list_local_files(prefix)
+        return storage.list(prefix)
     except Exception as e:
         logger.error(f"Failed to list files with prefix {prefix}: {str(e)}")
         raise
 
 def delete_file(file_path):
-    """Delete file from appropriate storage."""
+    """Delete file from the configured storage."""
     try:
-        if STORAGE_TYPE == "s3":
-            s3_client.delete_object(Bucket=s3_bucket, Key=file_path)
-            logger.info(f"Successfully deleted file from S3: {file_path}")
-        else:
-            delete_local_file(file_path)
+        storage.delete(file_path)
     except Exception as e:
         logger.error(f"Failed to delete file {file_path}: {str(e)}")
         raise
 
-def clean_html(content):
-    """Clean HTML content by removing scripts, styles, meta, and footer elements."""
+def flush_storage():
+    """Wait until everything saved during the run has been stored."""
     try:
-        if not content:
-            logger.warning("Empty content provided to clean_html")
-            return None
-        soup = BeautifulSoup(content, 'html.parser')
-        for tag in soup(['script', 'style', 'noscript', 'meta', 'footer']):
-            tag.decompose()
-        logger.info("Successfully cleaned HTML content")
-        return str(soup)
+        storage.flush()
+        logger.info("All files for this run are stored")
     except Exception as e:
-        logger.error(f"Failed to clean HTML: {str(e)}")
-        raise
+        logger.error(f"Failed to store files: {str(e)}")
 
-def extract_body_content(html):
-    """Extract body content from HTML."""
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-        body = soup.body if soup.body else soup
-        logger.info("Successfully extracted body content from HTML")
-        return body
-    except Exception as e:
-        logger.error(f"Failed to extract body content: {str(e)}")
-        raise
+def get_timestamp():
+    """Get current timestamp in formatted string."""
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    logger.debug(f"Generated timestamp: {timestamp}")
+    return timestamp
 
-def highlight_text_diff(text1, text2):
-    """Generates highlighted HTML diff for inline text changes."""
+def load_manifest(sanitised_link):
+    """Load the manifest of a link's stored files, building it from a listing the first time."""
     try:
-        diff = difflib.ndiff(text1.split(), text2.split())
-        highlighted_text = []
-        
-        for word in diff:
-            if word.startswith("- "):
-                highlighted_text.append(f'<span style="color: red; text-decoration: line-through;">{word[2:]}</span>')
-            elif word.startswith("+ "):
-                highlighted_text.append(f'<span style="color: green;">{word[2:]}</span>')
-            else:
-                highlighted_text.append(word)
-        
-        logger.info("Successfully generated text diff highlights")
-        return " ".join(highlighted_text)
+        content = read_file(manifest_path(sanitised_link))
+        if content:
+            manifest = LinkManifest.from_json(content)
+            logger.info(f"Found latest file for {sanitised_link}: {manifest.latest}")
+            return manifest
+
+        manifest = LinkManifest(sanitised_link)
+        for kind in PRUNED_KINDS:
+            files = sorted(list_files(f"{kind}/{sanitised_link}_"), key=lambda x: x['LastModified'])
+            for file in files:
+                manifest.add(file['Key'])
+        snapshots = manifest.history.get("html_runs")
+        if snapshots:
+            manifest.set_latest(snapshots[-1], read_snapshot_fingerprint(snapshots[-1]))
+            logger.info(f"Built manifest for {sanitised_link} from existing files, latest is {manifest.latest}")
+        else:
+            logger.warning(f"No existing files found for link: {sanitised_link}")
+        return manifest
     except Exception as e:
-        logger.error(f"Failed to highlight text differences: {str(e)}")
+        logger.error(f"Failed to load manifest for {sanitised_link}: {str(e)}")
         raise
 
-def highlight_differences(old_html, latest_html):
-    """Highlight differences between two HTML documents."""
+def save_manifest(manifest):
+    """Store a link's manifest as a single object, replacing the previous one."""
     try:
-        old_soup = BeautifulSoup(old_html, "html.parser")
-        latest_soup = BeautifulSoup(latest_html, "html.parser")
-
-        diff = difflib.ndiff(old_soup.prettify().splitlines(), latest_soup.prettify().splitlines())
-
-        modified_html = []
-        raw_diff = []
-        for line in diff:
-            if line.startswith("+ "):
-                modified_html.append(f'<ins style="background-color: lightgreen;">{line[2:]}</ins>')
-                raw_diff.append(f'<ins style="background-color: lightgreen;">{line[2:]}</ins>')
-            elif line.startswith("- "):
-                modified_html.append(f'<del style="background-color: lightcoral;">{line[2:]}</del>')
-                raw_diff.append(f'<del style="background-color: lightcoral;">{line[2:]}</del>')
-            else:
-                modified_html.append(line[2:])
-
-        logger.info("Successfully highlighted HTML differences")
-        return "\n".join(modified_html), "\n".join(raw_diff)
+        save_file(manifest_path(manifest.name), manifest.to_json())
     except Exception as e:
-        logger.error(f"Failed to highlight differences: {str(e)}")
+        logger.error(f"Failed to save manifest for {manifest.name}: {str(e)}")
         raise
 
+def snapshot_meta_path(snapshot_path):
+    """Map an html_runs/ snapshot key to the key of its metadata sidecar."""
+    name = os.path.splitext(os.path.basename(snapshot_path))[0]
+    return f"html_meta/{name}.json"
 
-def get_timestamp():
-    """Get current timestamp in formatted string."""
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    logger.debug(f"Generated timestamp: {timestamp}")
-    return timestamp
+def snapshot_views_path(snapshot_path):
+    """Map an html_runs/ snapshot key to the key of its precomputed views."""
+    name = os.path.splitext(os.path.basename(snapshot_path))[0]
+    return f"html_views/{name}.json"
 
-def get_latest_test_link_file(link):
-    """Get the latest test file for a given link."""
+def save_snapshot(snapshot_path, html, content_fingerprint, views=None, manifest=None):
+    """Save a cleaned HTML snapshot together with its content fingerprint and precomputed views."""
     try:
-        sanitised_link = remove_slashes(link)
-        prefix = f"html_runs/{sanitised_link}_"
-        files = list_files(prefix)
-        if not files:
-            logger.warning(f"No existing files found for link: {link}")
-            return None
-        latest_file = max(files, key=lambda x: x['LastModified'])['Key']
-        logger.info(f"Found latest file for {link}: {latest_file}")
-        return latest_file
+        save_file(snapshot_path, html)
+        save_file(snapshot_meta_path(snapshot_path), json.dumps({"fingerprint": content_fingerprint}))
+        if views:
+            save_file(snapshot_views_path(snapshot_path), json.dumps(views, ensure_ascii=False, separators=(",", ":")))
+        if manifest is not None:
+            manifest.set_latest(snapshot_path, content_fingerprint)
+            manifest.add(snapshot_meta_path(snapshot_path))
+            if views:
+                manifest.add(snapshot_views_path(snapshot_path))
     except Exception as e:
-        logger.error(f"Failed to get latest test link file for {link}: {str(e)}")
+        logger.error(f"Failed to save snapshot {snapshot_path}: {str(e)}")
         raise
 
-def cleanup_old_files(prefix, keep=3):
-    """Delete old files keeping only the most recent 'keep' number of files."""
+def read_snapshot_views(snapshot_path, signature):
+    """Read the precomputed views of a snapshot, or None if it has none for the current settings."""
     try:
-        keep = int(keep)
-        logger.info(f"Cleaning up old files with prefix {prefix}, keeping {keep} most recent")
-        
-        files = sorted(list_files(prefix), key=lambda x: x['LastModified'], reverse=True)
-        file_keys = [file['Key'] for file in files]
-        
-        if len(file_keys) <= keep:
-            logger.info(f"Found {len(file_keys)} files for prefix {prefix}, keeping all (<= {keep})")
-            return
-        
-        for file_key in file_keys[keep:]:
-            delete_file(file_key)
-            logger.info(f"Deleted old file: {file_key}")
+        content = read_file(snapshot_views_path(snapshot_path))
+        if not content:
+            return None
+        views = json.loads(content)
+        if views.get("signature") != signature:
+            logger.info(f"Stored views for {snapshot_path} were made with different settings, parsing the snapshot instead")
+            return None
+        return views
     except Exception as e:
-        logger.error(f"Failed to clean up old files with prefix {prefix}: {str(e)}")
-        raise
+        logger.warning(f"Failed to read stored views for {snapshot_path}: {str(e)}")
+        return None
 
-def download_html_from_link(url):
-    """Download HTML content from the provided link."""
+def read_snapshot_fingerprint(snapshot_path):
+    """Read the stored fingerprint of a snapshot, or None for snapshots saved without one."""
     try:
-        logger.info(f"Downloading HTML from {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        logger.info(f"Successfully downloaded HTML from {url}")
-        return response.text
-    except requests.RequestException as e:
-        logger.error(f"Failed to download HTML from {url}: {str(e)}")
+        content = read_file(snapshot_meta_path(snapshot_path))
+        if not content:
+            return None
+        return json.loads(content).get("fingerprint")
+    except Exception as e:
+        logger.warning(f"Failed to read fingerprint for {snapshot_path}: {str(e)}")
         return None
 
 def remove_slashes(link):
@@ -411,119 +235,92 @@ def remove_slashes(link):
     logger.debug(f"Sanitised link {link} to {sanitised}")
     return sanitised
 
-def prune_old_files(sanitised_link):
-    """Prune old files for a given sanitised link."""
+def prune_old_files(manifest, keep=KEEP_VERSIONS):
+    """Delete a link's files beyond the 'keep' most recent of each kind, and save its manifest."""
     try:
-        logger.info(f"Pruning old files for {sanitised_link}")
-        cleanup_old_files(f"differences/{sanitised_link}_", keep=3)
-        cleanup_old_files(f"html_runs/{sanitised_link}_", keep=3)
-        cleanup_old_files(f"summarys/{sanitised_link}_", keep=3)
-        cleanup_old_files(f"raw_diff/{sanitised_link}_", keep=3)
-        cleanup_old_files(f"summarys_chinese/{sanitised_link}_", keep=3)
+        logger.info(f"Pruning old files for {manifest.name}, keeping {keep} most recent")
+        for file_key in manifest.expired(keep):
+            delete_file(file_key)
+            logger.info(f"Deleted old file: {file_key}")
+        save_manifest(manifest)
     except Exception as e:
-        logger.error(f"Failed to prune old files for {sanitised_link}: {str(e)}")
+        logger.error(f"Failed to prune old files for {manifest.name}: {str(e)}")
         raise
 
-def extract_title(html):
-    """Extracts the title of the webpage from the HTML content."""
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-        title = soup.title.string if soup.title else "No Title"
-        logger.info(f"Extracted title: {title}")
-        return title
-    except Exception as e:
-        logger.error(f"Failed to extract title from HTML: {str(e)}")
-        return "No Title"
-
-def log_to_json(link, timestamp, title, chinese_title,url):
-    """Log activity to JSON file."""
+def log_to_json(state, link, timestamp, title, chinese_title,url):
+    """Record a link's activity in the run state, committed to logs.json at the end of the run."""
     try:
         sanitised_link = remove_slashes(link)
         logger.info(f"Logging activity for {link} at {timestamp}")
-        
-        if STORAGE_TYPE == "s3":
-            try:
-                logs_object = s3_client.get_object(Bucket=s3_bucket, Key=LOGS_KEY)
-                logs = json.loads(logs_object['Body'].read().decode('utf-8'))
-                logger.debug("Loaded logs from S3")
-            except s3_client.exceptions.NoSuchKey:
-                logs = []
-                logger.warning("No existing logs found on S3, initializing new log")
-        else:
-            ensure_local_storage()
-            logs_path = os.path.join("logs", "logs.json")
-            if os.path.exists(logs_path):
-                with open(logs_path, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-                logger.debug("Loaded logs from local storage")
-            else:
-                logs = []
-                logger.warning("No existing logs found locally, initializing new log")
-
-        log_entry = next((entry for entry in logs if entry['id'] == sanitised_link), None)
-        if log_entry:
-            log_entry['last_updated_at'] = timestamp
-            log_entry['title'] = title
-            log_entry['title_zh'] = chinese_title
-            log_entry['url'] = url
-            logger.debug(f"Updated existing log entry for {sanitised_link}")
-        else:
-            logs.append({
-                'id': sanitised_link,
-                'last_updated_at': timestamp,
-                'title': title,
-                'url':url,
-                'title_zh': chinese_title
-            })
-            logger.debug(f"Created new log entry for {sanitised_link}")
-
-        if STORAGE_TYPE == "s3":
-            s3_client.put_object(Bucket=s3_bucket, Key=LOGS_KEY, Body=json.dumps(logs, indent=4))
-            logger.info("Saved logs to S3")
-        else:
-            logs_path = os.path.join("logs", "logs.json")
-            with open(logs_path, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, indent=4)
-            logger.info("Saved logs to local storage")
+        state.update(sanitised_link, last_updated_at=timestamp, title=title, url=url, title_zh=chinese_title)
     except Exception as e:
         logger.error(f"Failed to log activity to JSON: {str(e)}")
         raise
 
-def extract_updated_at(id):
+def extract_updated_at(state, id):
     """Extract last updated timestamp for a given ID."""
     try:
-        if STORAGE_TYPE == "s3":
-            try:
-                logs_object = s3_client.get_object(Bucket=s3_bucket, Key=LOGS_KEY)
-                logs = json.loads(logs_object['Body'].read().decode('utf-8'))
-                logger.debug("Loaded logs from S3 for timestamp extraction")
-            except s3_client.exceptions.NoSuchKey:
-                logger.warning("No logs found on S3, using current timestamp")
-                return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        else:
-            if not os.path.exists(LOCAL_LOGS_PATH):
-                logger.warning("No local logs found, using current timestamp")
-                return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            with open(LOCAL_LOGS_PATH, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-            logger.debug("Loaded logs from local storage for timestamp extraction")
-
-        if len(logs) == 0:
-            logger.warning("Empty logs, using current timestamp")
-            return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-        for item in logs:
-            if item.get('id') == id:
-                timestamp = item.get("last_updated_at")
-                logger.info(f"Found timestamp for {id}: {timestamp}")
-                return timestamp
-        
+        entry = state.get(id)
+        if entry and entry.get("last_updated_at"):
+            timestamp = entry["last_updated_at"]
+            logger.info(f"Found timestamp for {id}: {timestamp}")
+            return timestamp
+
         logger.warning(f"No timestamp found for {id}, using current timestamp")
         return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     except Exception as e:
         logger.error(f"Failed to extract timestamp for {id}: {str(e)}")
         return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
+def record_unchanged(state, link, sanitised_link, english_title, chinese_title):
+    """Refresh the log entry of a link whose content did not change, keeping its last update time."""
+    old_time_stamp = extract_updated_at(state, id=sanitised_link)
+    log_to_json(state, link, timestamp=old_time_stamp, title=english_title, chinese_title=chinese_title, url=link)
+
+def commit_run_state(state):
+    """Write the run's log entries to logs.json in one go."""
+    try:
+        state.commit()
+    except Exception as e:
+        logger.error(f"Failed to commit run state to {LOGS_KEY}: {str(e)}")
+    finally:
+        state.close()
+
+def load_validators():
+    """Load the HTTP cache validators (ETag / Last-Modified) saved by the previous run."""
+    try:
+        content = read_file(VALIDATORS_KEY)
+        if not content:
+            logger.info("No stored cache validators found, fetching all pages unconditionally")
+            return {}
+        validators = json.loads(content)
+        logger.info(f"Loaded cache validators for {len(validators)} links")
+        return validators
+    except Exception as e:
+        logger.error(f"Failed to load cache validators, fetching all pages unconditionally: {str(e)}")
+        return {}
+
+def load_noise_filter():
+    """Load the noise rules applied to both versions of every page before diffing."""
+    try:
+        content = read_file(NOISE_RULES_KEY)
+        if not content:
+            logger.info(f"No noise rules found at {NOISE_RULES_KEY}, using the default date and site search rules")
+        noise = NoiseFilter.from_json(content)
+        logger.info(f"Loaded {len(noise.rules)} noise rules")
+        return noise
+    except Exception as e:
+        logger.error(f"Failed to load noise rules from {NOISE_RULES_KEY}, using the defaults: {str(e)}")
+        return NoiseFilter.from_json(None)
+
+def save_validators(validators):
+    """Persist the HTTP cache validators for the next run."""
+    try:
+        save_file(VALIDATORS_KEY, json.dumps(validators, indent=4))
+        logger.info(f"Saved cache validators for {len(validators)} links")
+    except Exception as e:
+        logger.error(f"Failed to save cache validators: {str(e)}")
+
 def load_links_from_json(file_path):
     """Load URLs to monitor from JSON file."""
     try:
@@ -551,7 +348,12 @@ def load_links_from_json(file_path):
 
 def initiate_cron():
 
-    summarizer = ChangeSummarizer(logger,openai_client=client)
+    cache = SummaryCache(logger, read_file, save_file) if SUMMARY_CACHE else None
+    memory = SummaryCache(
+        logger, read_file, save_file, key=TRANSLATION_MEMORY_KEY, max_bytes=TRANSLATION_MEMORY_MAX_BYTES, name="Translation memory"
+    ) if TRANSLATION_MEMORY else None
+    summarizer = ChangeSummarizer(logger,openai_client=client, cache=cache, limiter=llm_limiter, memory=memory)
+    run_state = get_run_state(logger, read_file, save_file)
     try:
         logger.info("Initiating cron job")
         
@@ -568,57 +370,89 @@ def initiate_cron():
         master_summary_content = []
         master_summary_content_chinese = []
         
-        for key, val in links.items():
+        pages = {key: val.get("url") for key, val in links.items()}
+        stored_validators = load_validators()
+        validators = {
+            key: entry for key, entry in stored_validators.items()
+            if key in pages and entry.get("url") == pages[key]
+        }
+        not_modified_count = 0
+        fingerprint_stats = {"hits": 0, "misses": 0, "text_hits": 0, "baselines": 0}
+        pending = {}
+        llm_pending = {}
+        summaries = {}
+        translations = {}
+        noise = load_noise_filter()
+
+        def finish_link(future, ctx):
+            """Store and summarise the result of one link's comparison stage."""
+            link = ctx["link"]
+            sanitised_link = ctx["sanitised_link"]
+            title = ctx["title"]
+            english_title = ctx["english_title"]
+            chinese_title = ctx["chinese_title"]
+            timestamp = ctx["timestamp"]
+            existing_file = ctx["existing_file"]
+            manifest = ctx["manifest"]
             try:
-                link = val.get("url")
-                title = val.get("english")
-                sanitised_link = title
-                timestamp = get_timestamp()
-                existing_file = get_latest_test_link_file(link=sanitised_link)
-                chinese_title = val.get("chinese")
-                english_title = val.get("english")
-                
-                logger.info(f"Processing link: {link}")
-                
+                comparison = future.result()
+                if not comparison.fingerprint:
+                    logger.error(f"Failed to download latest HTML for {link}. Skipping.")
+                    return
+
                 if not existing_file:
                     logger.info(f"No existing file found for {link}. Using the link as the baseline.")
-                    old_html = download_html_from_link(link)
-                    old_html = clean_html(old_html)
-                    if not old_html:
-                        logger.error(f"Failed to download HTML for {link}. Skipping this run.")
-                        continue
                     file2_save_path = f"html_runs/{sanitised_link}_{timestamp}.html"
-                    save_file(file2_save_path, old_html)
+                    save_snapshot(file2_save_path, comparison.latest_html, comparison.fingerprint, comparison.views, manifest)
+                    save_manifest(manifest)
                     logger.info(f"Latest HTML for {link} saved to {file2_save_path}")
-                else:
-                    old_html = read_file(existing_file)
-                    logger.debug(f"Using existing HTML file: {existing_file}")
-                
-                latest_html = download_html_from_link(link)
-                latest_html = clean_html(latest_html)
-                latest_git_text = extract_plain_text(latest_html)
-                old_git_text = extract_plain_text(old_html)
-
-
-                if not latest_html:
-                    logger.error(f"Failed to download latest HTML for {link}. Skipping.")
-                    continue
-
-                logger.info(f"Comparing {existing_file if existing_file else 'new file'} with {link}")
-                git_difference = generate_diff(old_git_text, latest_git_text)
-                diff_html, raw_diff_html = highlight_differences(old_html, latest_html)
-                raw_diff_html = remove_date_lines(raw_diff_html)
-                raw_diff_html = remove_search_lines(raw_diff_html)
-
-
+                    # A first baseline has nothing to compare against: not a fingerprint hit.
+                    fingerprint_stats["baselines"] += 1
+                    record_unchanged(run_state, link, sanitised_link, english_title, chinese_title)
+                    validators[ctx["key"]] = dict(ctx["validators"], url=link)
+                    return
+
+                if comparison.needs_baseline:
+                    old_html = None
+                    old_views = read_snapshot_views(existing_file, views_signature(ctx["rules"]))
+                    if old_views:
+                        logger.debug(f"Using stored views of {existing_file}")
+                    else:
+                        logger.debug(f"Using existing HTML file: {existing_file}")
+                        old_html = read_file(existing_file)
+                    if old_html is None and old_views is None:
+                        # The manifest points at a snapshot that is gone (a failed upload or a manual delete).
+                        logger.warning(f"Baseline {existing_file} for {link} is missing. Using the link as the new baseline.")
+                        file2_save_path = f"html_runs/{sanitised_link}_{timestamp}.html"
+                        save_snapshot(file2_save_path, comparison.latest_html, comparison.fingerprint, comparison.views, manifest)
+                        save_manifest(manifest)
+                        fingerprint_stats["baselines"] += 1
+                        record_unchanged(run_state, link, sanitised_link, english_title, chinese_title)
+                        validators[ctx["key"]] = dict(ctx["validators"], url=link)
+                        return
+                    future = executor.submit(compare_baseline, comparison, old_html, old_views, ctx["old_fingerprint"], ctx["rules"], noise)
+                    pending[future] = ctx
+                    return
+
+                if comparison.unchanged:
+                    fingerprint_stats["hits"] += 1
+                    logger.info(f"Content fingerprint unchanged for {link}. Skipping comparison.")
+                    record_unchanged(run_state, link, sanitised_link, english_title, chinese_title)
+                    validators[ctx["key"]] = dict(ctx["validators"], url=link)
+                    return
+                fingerprint_stats["misses"] += 1
+                if comparison.text_unchanged:
+                    fingerprint_stats["text_hits"] += 1
+                    logger.info(f"Text fingerprint unchanged for {link}. Skipped text diff.")
+
+                git_difference = comparison.git_difference
+                raw_diff_html = comparison.raw_diff_html
 
                 # ✅ Only save if differences exist
                 if git_difference.strip():
                    git_diff = f"git_differences/{title}_{timestamp}.html"
                    save_file(git_diff, git_difference)
-                   summary_git = summarizer.summarize_changes(git_difference)
-                   summary_save_path = f"summarys_git/{sanitised_link}_{timestamp}.txt"
-                   save_file(summary_save_path, summary_git)
+                   llm_pending[llm.submit(summarizer.summarize_changes, git_difference)] = ("git", ctx)
 
                 else:
                     logger.info("No differences found, nothing saved.")
@@ -626,41 +460,162 @@ def initiate_cron():
                 
                 if not raw_diff_html.strip():
                     logger.info(f"No differences found for {link}. Skipping file generation.")
-                    old_time_stamp = extract_updated_at(id=sanitised_link)
-                    log_to_json(link, timestamp=old_time_stamp, title=english_title, chinese_title=chinese_title,url=link)
-                    continue
-                else:
-                    diff_filename = f"differences/{sanitised_link}_{timestamp}.html"
-                    file2_save_path = f"html_runs/{sanitised_link}_{timestamp}.html"
-                    raw_diff_path = f"raw_diff/{sanitised_link}_{timestamp}.html"
-                    
-                    log_to_json(link, timestamp=datetime.now().strftime("%Y-%m-%d_%H-%M-%S"), 
-                              title=english_title, chinese_title=chinese_title,url=link)
+                    if not git_difference.strip():
+                        # Only noise changed: make this page the baseline, so the next run
+                        # matches its fingerprint instead of diffing the same noise again.
+                        file2_save_path = f"html_runs/{sanitised_link}_{timestamp}.html"
+                        save_snapshot(file2_save_path, comparison.latest_html, comparison.fingerprint, comparison.views, manifest)
+                        prune_old_files(manifest)
+                        logger.info(f"Refreshed baseline of {link} at {file2_save_path}")
+                    record_unchanged(run_state, link, sanitised_link, english_title, chinese_title)
+                    validators[ctx["key"]] = dict(ctx["validators"], url=link)
+                    return
+
+                diff_filename = f"differences/{sanitised_link}_{timestamp}.html"
+                file2_save_path = f"html_runs/{sanitised_link}_{timestamp}.html"
+                raw_diff_path = f"raw_diff/{sanitised_link}_{timestamp}.html"
+                
+                log_to_json(run_state, link, timestamp=datetime.now().strftime("%Y-%m-%d_%H-%M-%S"), 
+                          title=english_title, chinese_title=chinese_title,url=link)
+
+                save_snapshot(file2_save_path, comparison.latest_html, comparison.fingerprint, comparison.views, manifest)
+                save_file(diff_filename, comparison.diff_html)
+                save_file(raw_diff_path, raw_diff_html)
+                manifest.add(diff_filename)
+                manifest.add(raw_diff_path)
 
-                    save_file(file2_save_path, latest_html)
-                    save_file(diff_filename, diff_html)
-                    save_file(raw_diff_path, raw_diff_html)
+                logger.info(f"Diff for {link} saved to {diff_filename}")
+                logger.info(f"Raw diff for {link} saved to {raw_diff_path}")
 
-                    logger.info(f"Diff for {link} saved to {diff_filename}")
-                    logger.info(f"Raw diff for {link} saved to {raw_diff_path}")
+                llm_pending[llm.submit(summarizer.summarize_changes, comparison.summary_input)] = ("summary", ctx)
+                prune_old_files(manifest)
+                    
+            except Exception as e:
+                logger.error(f"Error processing link {link}: {str(e)}")
 
-                    body_tag = extract_body_content(raw_diff_html)
-                    summary = summarizer.summarize_changes(str(body_tag))
+        def finish_summary(future, kind, ctx):
+            """Store the summaries of one link once the LLM stage has produced them."""
+            link = ctx["link"]
+            sanitised_link = ctx["sanitised_link"]
+            timestamp = ctx["timestamp"]
+            try:
+                if kind == "git":
+                    summary_save_path = f"summarys_git/{sanitised_link}_{timestamp}.txt"
+                    save_file(summary_save_path, future.result())
+                    return
+
+                if kind == "summary":
+                    summary = future.result()
                     summary_save_path = f"summarys/{sanitised_link}_{timestamp}.txt"
                     save_file(summary_save_path, summary)
+                    ctx["manifest"].add(summary_save_path)
+                    prune_old_files(ctx["manifest"])
+                    summaries[ctx["key"]] = f"------- {link} -------\n{summary}\n"
+                    llm_pending[batcher.submit(summary)] = ("translation", ctx)
+                    return
+
+                summary_chinese = future.result()
+                summary_save_path_chinese = f"summarys_chinese/{sanitised_link}_{timestamp}.txt"
+                save_file(summary_save_path_chinese, summary_chinese)
+                ctx["manifest"].add(summary_save_path_chinese)
+                prune_old_files(ctx["manifest"])
+                translations[ctx["key"]] = f"------- {link} -------\n{summary_chinese}\n"
+                validators[ctx["key"]] = dict(ctx["validators"], url=link)
+            except Exception as e:
+                logger.error(f"Error summarising changes for {link}: {str(e)}")
 
-                    summary_chinese =  summarizer.translate_text(summary)
-                    summary_save_path_chinese = f"summarys_chinese/{sanitised_link}_{timestamp}.txt"
-                    save_file(summary_save_path_chinese, summary_chinese)
-
-                    master_summary_content.append(f"------- {link} -------\n{summary}\n")
-                    master_summary_content_chinese.append(f"------- {link} -------\n{summary_chinese}\n")
-                    
-                    prune_old_files(sanitised_link)
+        with get_executor() as executor, ThreadPoolExecutor(max_workers=max(1, LLM_WORKERS)) as llm:
+            batcher = TranslationBatcher(summarizer, llm)
+            for fetched in iter_fetch(pages, logger, validators=validators):
+                try:
+                    val = links[fetched.key]
+                    link = fetched.url
+                    title = val.get("english")
+                    sanitised_link = title
+                    timestamp = get_timestamp()
+                    manifest = load_manifest(sanitised_link)
+                    existing_file = manifest.latest
+                    chinese_title = val.get("chinese")
+                    english_title = val.get("english")
                     
-            except Exception as e:
-                logger.error(f"Error processing link {link}: {str(e)}")
-                continue
+                    logger.info(f"Processing link: {link}")
+
+                    if fetched.not_modified:
+                        if not existing_file:
+                            logger.warning(f"{link} returned 304 but no baseline exists. Refetching next run.")
+                            validators.pop(fetched.key, None)
+                            continue
+                        logger.info(f"{link} not modified since last run (HTTP 304). Skipping comparison.")
+                        not_modified_count += 1
+                        record_unchanged(run_state, link, sanitised_link, english_title, chinese_title)
+                        continue
+
+                    # Forget validators until this response has been fully processed, so a
+                    # failure below cannot make the next run skip an unseen change.
+                    validators.pop(fetched.key, None)
+
+                    old_html = None
+                    old_fingerprint = None
+                    if existing_file:
+                        old_fingerprint = manifest.fingerprint or read_snapshot_fingerprint(existing_file)
+                        if not old_fingerprint:
+                            old_html = read_file(existing_file)
+                            if old_html is None:
+                                logger.warning(f"Baseline {existing_file} for {link} is missing. Using the link as the new baseline.")
+                                manifest.forget_latest()
+                                existing_file = None
+
+                    ctx = {
+                        "key": fetched.key,
+                        "link": link,
+                        "title": title,
+                        "sanitised_link": sanitised_link,
+                        "english_title": english_title,
+                        "chinese_title": chinese_title,
+                        "timestamp": timestamp,
+                        "existing_file": existing_file,
+                        "manifest": manifest,
+                        "old_fingerprint": old_fingerprint,
+                        "validators": fetched.validators,
+                        "rules": boilerplate_rules(val),
+                    }
+                    pending[executor.submit(compare_page, fetched.text, old_html, old_fingerprint, ctx["rules"], noise)] = ctx
+                except Exception as e:
+                    logger.error(f"Error processing link {link}: {str(e)}")
+                    continue
+
+                for future in [f for f in pending if f.done()]:
+                    finish_link(future, pending.pop(future))
+                for future in [f for f in llm_pending if f.done()]:
+                    finish_summary(future, *llm_pending.pop(future))
+
+            while pending or llm_pending:
+                if not pending and all(kind == "translation" for kind, _ in llm_pending.values()):
+                    # No more summaries can arrive, so send the last, partly filled batch.
+                    batcher.flush()
+                done, _ = wait(list(pending) + list(llm_pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in pending:
+                        finish_link(future, pending.pop(future))
+                    else:
+                        finish_summary(future, *llm_pending.pop(future))
+
+        # The master summaries list links in urls.json order, whatever order their summaries finished in.
+        for key in links:
+            if key in summaries and key in translations:
+                master_summary_content.append(summaries[key])
+                master_summary_content_chinese.append(translations[key])
+
+        logger.info(f"{not_modified_count} of {len(links)} links were not modified (HTTP 304)")
+        logger.info(
+            f"Fingerprint check: {fingerprint_stats['hits']} hits, {fingerprint_stats['misses']} misses "
+            f"({fingerprint_stats['text_hits']} text-only hits), {fingerprint_stats['baselines']} new baselines"
+        )
+        save_validators(validators)
+        if cache is not None:
+            cache.flush()
+        if memory is not None:
+            memory.flush()
 
         if master_summary_content:
             final_summary = "\n".join(master_summary_content)
@@ -677,6 +632,9 @@ def initiate_cron():
     except Exception as e:
         logger.error(f"Failed to complete cron job: {str(e)}")
         raise
+    finally:
+        commit_run_state(run_state)
+        flush_storage()
 
 # Set up scheduling
 if STORAGE_TYPE != 's3':
@@ -0,0 +1,146 @@
+import argparse
+import difflib
+import json
+import random
+import time
+
+from utils import highlight_lines, highlight_text_diff
+
+STRUCTURE = ["<div>", "</div>", "<li>", "</li>", "<p>", "</p>", "<ul>", "</ul>", "<span>", "</span>"]
+
+
+def synthetic_page(lines: int, seed: int):
+    """Prettified-page-like lines: mostly repeated tag lines with unique text lines between them."""
+    rng = random.Random(seed)
+    page = []
+    for index in range(lines):
+        if rng.random() < 0.6:
+            page.append(" " * rng.randrange(1, 12) + rng.choice(STRUCTURE))
+        else:
+            page.append(" " * rng.randrange(1, 12) + f"Paragraph text {index} about programme {rng.randrange(lines)}")
+    return page
+
+
+def mutate(page, change_rate: float, seed: int):
+    """Replaces, inserts and deletes roughly change_rate of the lines, in small clusters."""
+    rng = random.Random(seed)
+    changed = list(page)
+    for _ in range(max(1, int(len(page) * change_rate / 3))):
+        position = rng.randrange(len(changed))
+        for offset in range(3):
+            if position + offset >= len(changed):
+                break
+            roll = rng.random()
+            if roll < 0.6:
+                changed[position + offset] = changed[position + offset] + " (updated)"
+            elif roll < 0.8:
+                changed.insert(position + offset, "    New sentence added")
+            else:
+                del changed[position + offset]
+    return changed
+
+
+def synthetic_text(words: int, paragraph_words: int, seed: int) -> str:
+    """Page-like text: paragraphs of paragraph_words words drawn from a modest vocabulary."""
+    rng = random.Random(seed)
+    vocabulary = [f"word{index}" for index in range(2000)] + ["the", "a", "of", "and", "to", "in"] * 200
+    tokens = [rng.choice(vocabulary) for _ in range(words)]
+    return "\n".join(" ".join(tokens[start:start + paragraph_words]) for start in range(0, words, paragraph_words))
+
+
+def mutate_words(text: str, change_rate: float, seed: int) -> str:
+    """Replaces, inserts and deletes roughly change_rate of the words, keeping paragraph breaks."""
+    rng = random.Random(seed)
+    paragraphs = [paragraph.split() for paragraph in text.split("\n")]
+    total = sum(len(words) for words in paragraphs)
+    for _ in range(max(1, int(total * change_rate))):
+        words = rng.choice(paragraphs)
+        position = rng.randrange(len(words))
+        roll = rng.random()
+        if roll < 0.6:
+            words[position] = "changed"
+        elif roll < 0.8:
+            words.insert(position, "inserted")
+        elif len(words) > 1:
+            del words[position]
+    return "\n".join(" ".join(words) for words in paragraphs)
+
+
+def legacy_highlight_text_diff(text1, text2):
+    """The previous difflib.ndiff based word diff, kept for comparison."""
+    highlighted_text = []
+    for word in difflib.ndiff(text1.split(), text2.split()):
+        if word.startswith("- "):
+            highlighted_text.append(f'<span style="color: red; text-decoration: line-through;">{word[2:]}</span>')
+        elif word.startswith("+ "):
+            highlighted_text.append(f'<span style="color: green;">{word[2:]}</span>')
+        else:
+            highlighted_text.append(word)
+    return " ".join(highlighted_text)
+
+
+def legacy_highlight_lines(old_lines, latest_lines):
+    """The previous difflib.ndiff based implementation, kept for comparison."""
+    modified_html = []
+    raw_diff = []
+    for line in difflib.ndiff(old_lines, latest_lines):
+        if line.startswith("+ "):
+            modified_html.append(f'<ins style="background-color: lightgreen;">{line[2:]}</ins>')
+            raw_diff.append(f'<ins style="background-color: lightgreen;">{line[2:]}</ins>')
+        elif line.startswith("- "):
+            modified_html.append(f'<del style="background-color: lightcoral;">{line[2:]}</del>')
+            raw_diff.append(f'<del style="background-color: lightcoral;">{line[2:]}</del>')
+        else:
+            modified_html.append(line[2:])
+    return "\n".join(modified_html), "\n".join(raw_diff)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark highlight_lines (or highlight_text_diff) against the legacy ndiff implementations.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated page sizes in lines")
+    parser.add_argument("--change-rate", type=float, default=0.01, help="Fraction of lines changed")
+    parser.add_argument("--legacy-max", type=int, default=20000, help="Skip the legacy run above this many lines")
+    parser.add_argument("--words", default="", help="Comma-separated word counts: benchmark highlight_text_diff instead")
+    parser.add_argument("--paragraph-words", type=int, default=100, help="Words per paragraph for --words (0 for one paragraph)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    if args.words:
+        for size in (int(value) for value in args.words.split(",")):
+            old_text = synthetic_text(size, args.paragraph_words or size, seed=size)
+            new_text = mutate_words(old_text, args.change_rate, seed=size + 1)
+            new_seconds, _ = timed(highlight_text_diff, old_text, new_text)
+            row = {"words": size, "new_seconds": round(new_seconds, 4)}
+            if size <= args.legacy_max:
+                legacy_seconds, _ = timed(legacy_highlight_text_diff, old_text, new_text)
+                row["legacy_seconds"] = round(legacy_seconds, 4)
+                row["speedup"] = round(legacy_seconds / new_seconds, 1) if new_seconds else None
+            results.append(row)
+    else:
+        for size in (int(value) for value in args.sizes.split(",")):
+            old_lines = synthetic_page(size, seed=size)
+            latest_lines = mutate(old_lines, args.change_rate, seed=size + 1)
+            new_seconds, (_, raw_diff) = timed(highlight_lines, old_lines, latest_lines)
+            row = {"lines": size, "new_seconds": round(new_seconds, 4), "changed_lines": raw_diff.count("\n") + 1}
+            if size <= args.legacy_max:
+                legacy_seconds, _ = timed(legacy_highlight_lines, old_lines, latest_lines)
+                row["legacy_seconds"] = round(legacy_seconds, 4)
+                row["speedup"] = round(legacy_seconds / new_seconds, 1) if new_seconds else None
+            results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        unit = "words" if args.words else "lines"
+        print(f"{unit:>8} {'legacy (s)':>12} {'new (s)':>10} {'speedup':>8}")
+        for row in results:
+            legacy = f"{row['legacy_seconds']:.3f}" if "legacy_seconds" in row else "skipped"
+            speedup = f"{row['speedup']}x" if row.get("speedup") else "-"
+            print(f"{row[unit]:>8} {legacy:>12} {row['new_seconds']:>10.3f} {speedup:>8}")
@@ -0,0 +1,337 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "application permanent residence citizenship visa study permit work permit applicants family sponsorship "
+    "eligibility processing times fees biometrics documents refugees employers travel document program stream "
+    "express entry provincial nominee caregivers students spouse partner dependent children proof funds "
+    "medical exam police certificate interview decision online account portal submit request renewal"
+).split()
+MARKER = re.compile(r"^<<<(\d+)>>>[ \t]*$", re.M)
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randrange(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def synthetic_page(index: int, version: int, sections: int, edit_rate: float) -> str:
+    """
+    A canada.ca-like page: breadcrumb, menu, a main body of sections with
+    paragraphs and lists, page details and footer. Each version rewrites
+    roughly edit_rate of the paragraphs of the one before and moves the
+    "Date modified" and build id, the way a real content update does.
+    """
+    blocks = []
+    for section in range(sections):
+        blocks.append(f"<h2>Section {section + 1}</h2>")
+        for paragraph in range(5):
+            # A paragraph's text comes from the last version that edited it.
+            edited = 0
+            for candidate in range(version, 0, -1):
+                if random.Random(f"{index}-{section}-{paragraph}-edit-{candidate}").random() < edit_rate:
+                    edited = candidate
+                    break
+            rng = random.Random(f"{index}-{section}-{paragraph}-{edited}")
+            if paragraph == 4:
+                items = "".join(f"<li>{sentence(rng)}</li>" for _ in range(rng.randrange(2, 6)))
+                blocks.append(f"<ul>{items}</ul>")
+            else:
+                blocks.append(f"<p>{' '.join(sentence(rng) for _ in range(rng.randrange(2, 5)))}</p>")
+    body = "\n".join(blocks)
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Page {index} - Canada.ca</title>
+<script>var build = "b{version}-{index}";</script></head>
+<body>
+<nav id="wb-bc" class="breadcrumb"><ol><li><a href="/en.html">Canada.ca</a></li><li>Immigration and citizenship</li></ol></nav>
+<header class="gcweb-menu"><ul><li>Jobs</li><li>Immigration and citizenship</li><li>Travel and tourism</li></ul></header>
+<main property="mainContentOfPage"><h1>Page {index}</h1>
+{body}
+<section class="pagedetails"><dl><dt>Date modified:</dt><dd><time>2024-{version % 12 + 1:02d}-{index % 28 + 1:02d}</time></dd></dl></section>
+</main>
+<footer class="gc-main-footer"><p>Government of Canada</p></footer>
+</body></html>"""
+
+
+def fake_completion(prompt: str) -> str:
+    """Deterministic stand-in for a chat completion, shaped like the replies the pipeline expects."""
+    if prompt.startswith("Translate"):
+        text = prompt.split("\n\n", 1)[1] if "\n\n" in prompt else prompt
+        if MARKER.search(text):
+            parts = MARKER.split(text)
+            return "\n".join(f"<<<{parts[i]}>>>\n[zh] {parts[i + 1].strip()}" for i in range(1, len(parts), 2))
+        return f"[zh] {text}"
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    changed = sum(1 for line in prompt.splitlines() if line.startswith(("+", "-", "<ins", "<del")))
+    return f"- Summary {digest[:8]}: {changed} changed lines.\n- The page content was updated."
+
+
+class BenchServer:
+    """Serves the synthetic pages, with ETags, and a fake OpenAI chat completions endpoint."""
+
+    def __init__(self, pages: int, sections: int, edit_rate: float, page_latency: float, llm_latency: float, etags: bool):
+        self.pages = pages
+        self.sections = sections
+        self.edit_rate = edit_rate
+        self.page_latency = page_latency
+        self.llm_latency = llm_latency
+        self.etags = etags
+        self.versions = [0] * pages
+        self.bodies = {}
+        self.llm_requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def page(self, index: int, version: int) -> bytes:
+        if (index, version) not in self.bodies:
+            self.bodies[index, version] = synthetic_page(index, version, self.sections, self.edit_rate).encode("utf-8")
+        return self.bodies[index, version]
+
+    def _handler(self):
+        bench = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if status != 304:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                match = re.match(r"^/page/(\d+)$", self.path)
+                if not match or int(match.group(1)) >= bench.pages:
+                    self._send(404)
+                    return
+                index = int(match.group(1))
+                time.sleep(bench.page_latency)
+                body = bench.page(index, bench.versions[index])
+                headers = {}
+                if bench.etags:
+                    headers["ETag"] = f'"{hashlib.md5(body).hexdigest()}"'
+                    if self.headers.get("If-None-Match") == headers["ETag"]:
+                        self._send(304, headers=headers)
+                        return
+                self._send(200, body, headers=headers)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with bench.lock:
+                    bench.llm_requests += 1
+                time.sleep(bench.llm_latency)
+                prompt = request["messages"][-1]["content"]
+                content = fake_completion(prompt)
+                prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4 + 1
+                completion_tokens = len(content) // 4 + 1
+                body = json.dumps({
+                    "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": request["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }).encode("utf-8")
+                self._send(200, body, content_type="application/json")
+
+        return Handler
+
+    def change_pages(self, change_rate: float, seed: int) -> int:
+        """Publishes a new version of roughly change_rate of the pages; returns how many."""
+        rng = random.Random(seed)
+        changed = [index for index in range(self.pages) if rng.random() < change_rate]
+        for index in changed:
+            self.versions[index] += 1
+        return len(changed)
+
+
+class StageTimer:
+    """Accumulated seconds and calls per stage. Stages that run on worker threads overlap, so their sum can exceed wall time."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, calls: int = 1) -> None:
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += calls
+
+    def as_dict(self):
+        return {stage: {"seconds": round(self.seconds[stage], 4), "calls": self.calls[stage]} for stage in sorted(self.seconds)}
+
+
+def timed_call(fn, *args):
+    """Runs a diff stage task and records its duration on the result, which may come back from another process."""
+    start = time.perf_counter()
+    result = fn(*args)
+    result.bench_seconds = time.perf_counter() - start
+    return result
+
+
+class TimedExecutor:
+    """Wraps the diff stage executor so each task's own run time is added to the timer."""
+
+    def __init__(self, executor, timer: StageTimer):
+        self.executor = executor
+        self.timer = timer
+
+    def __enter__(self):
+        self.executor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.executor.__exit__(*exc)
+
+    def submit(self, fn, *args):
+        future = self.executor.submit(timed_call, fn, *args)
+        future.add_done_callback(self._record)
+        return future
+
+    def _record(self, future):
+        if not future.exception():
+            self.timer.add("diff", future.result().bench_seconds)
+
+
+def instrument(app, model, timer_ref):
+    """Patches the pipeline's stage entry points to report into timer_ref[0]."""
+    timer = lambda: timer_ref[0]
+
+    def stage(name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timer().add(name, time.perf_counter() - start)
+        return wrapper
+
+    iter_fetch = app.iter_fetch
+
+    def timed_iter_fetch(*args, **kwargs):
+        # Time the main thread spends waiting for the next downloaded page.
+        results = iter_fetch(*args, **kwargs)
+        while True:
+            start = time.perf_counter()
+            try:
+                fetched = next(results)
+            except StopIteration:
+                timer().add("fetch_wait", time.perf_counter() - start, calls=0)
+                return
+            timer().add("fetch_wait", time.perf_counter() - start)
+            yield fetched
+
+    get_executor = app.get_executor
+    app.iter_fetch = timed_iter_fetch
+    app.get_executor = lambda *args: TimedExecutor(get_executor(*args), timer())
+    app.read_file = stage("storage_read", app.read_file)
+    app.save_file = stage("storage_write", app.save_file)
+    model.ChangeSummarizer._create_completion = stage("llm_request", model.ChangeSummarizer._create_completion)
+    model.ChangeSummarizer.summarize_changes = stage("summarize", model.ChangeSummarizer.summarize_changes)
+    model.ChangeSummarizer.translate_batch = stage("translate", model.ChangeSummarizer.translate_batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark initiate_cron end to end against local synthetic pages and a fake OpenAI backend.")
+    parser.add_argument("--pages", type=int, default=50, help="Number of monitored pages")
+    parser.add_argument("--sections", type=int, default=20, help="Sections per page (each about 5 paragraphs)")
+    parser.add_argument("--runs", type=int, default=3, help="Runs after the first, baseline run")
+    parser.add_argument("--change-rate", type=float, default=0.3, help="Fraction of pages changed before each run")
+    parser.add_argument("--edit-rate", type=float, default=0.05, help="Fraction of a changed page's paragraphs rewritten")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Seconds before each page response")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before each fake completion")
+    parser.add_argument("--no-etags", action="store_true", help="Serve pages without ETags, so every page is downloaded")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for which pages change")
+    parser.add_argument("--keep", default="", help="Run in this directory and keep it, instead of a temporary one")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's INFO logging (otherwise only errors are shown)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    source = os.path.dirname(os.path.abspath(__file__))
+    work = args.keep or tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.makedirs(work, exist_ok=True)
+    server = BenchServer(args.pages, args.sections, args.edit_rate, args.page_latency, args.llm_latency, not args.no_etags)
+
+    # app reads its configuration and sets up logging when imported.
+    os.environ.update(STORAGE_TYPE="local", apiKey="bench", OPENAI_BASE_URL=f"{server.url}/v1")
+    os.chdir(work)
+    with open("urls.json", "w") as f:
+        json.dump({
+            f"P{index}": {"english": f"Page{index}", "chinese": f"页面{index}", "url": f"{server.url}/page/{index}"}
+            for index in range(args.pages)
+        }, f)
+    shutil.copy(os.path.join(source, "noise_rules.json"), "noise_rules.json")
+    sys.path.insert(0, source)
+    import app
+    import model
+    import logging
+    if not args.verbose:
+        app.logger.setLevel(logging.ERROR)
+
+    timer_ref = [StageTimer()]
+    instrument(app, model, timer_ref)
+
+    results = []
+    try:
+        for run in range(args.runs + 1):
+            changed = server.change_pages(args.change_rate, seed=args.seed * 1000 + run) if run else args.pages
+            timer_ref[0] = StageTimer()
+            requests_before = server.llm_requests
+            start = time.perf_counter()
+            app.initiate_cron()
+            wall = time.perf_counter() - start
+            results.append({
+                "run": run,
+                "baseline": run == 0,
+                "changed_pages": changed,
+                "wall_seconds": round(wall, 4),
+                "pages_per_second": round(args.pages / wall, 2) if wall else None,
+                "llm_requests": server.llm_requests - requests_before,
+                "stages": timer_ref[0].as_dict(),
+            })
+    finally:
+        server.server.shutdown()
+        if not args.keep:
+            os.chdir(source)
+            shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "verbose", "keep")},
+        "env": {key: os.environ[key] for key in sorted(os.environ) if key.startswith(("DIFF_", "HTML_", "LLM_", "SUMMARY_", "TRANSLATION_", "FETCH_", "TEXT_DIFF", "INLINE_"))},
+        "runs": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    stages = sorted({stage for row in results for stage in row["stages"]})
+    print(f"{'run':>4} {'changed':>8} {'wall (s)':>9} {'pages/s':>8} {'llm req':>8} " + " ".join(f"{stage:>14}" for stage in stages))
+    for row in results:
+        cells = " ".join(f"{row['stages'].get(stage, {}).get('seconds', 0):>14.3f}" for stage in stages)
+        print(f"{row['run']:>4} {row['changed_pages']:>8} {row['wall_seconds']:>9.3f} {row['pages_per_second']:>8} {row['llm_requests']:>8} {cells}")
+
+
+if __name__ == "__main__":
+    main()
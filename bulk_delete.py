@@ -9,6 +9,9 @@ if __name__ == "__main__":
             "logs",
             "system_logs",
             "html_runs",
+            "html_meta",
+            "html_views",
+            "manifests",
             "differences",
             "summarys",
             "raw_diff",
@@ -0,0 +1,68 @@
+import difflib
+import glob
+import os
+import sys
+import time
+
+from document import ParsedDocument
+from parsers import BACKENDS
+from storage import read_text
+
+REFERENCE_BACKEND = "html.parser"
+
+
+def compare_file(path, backends):
+    """Parses one page with every backend and returns (timings, mismatching backends)."""
+    html = read_text(path, errors="replace")
+
+    timings = {}
+    documents = {}
+    for name in backends:
+        start = time.perf_counter()
+        document = ParsedDocument(html, backend=name)
+        document.cleaned_markup
+        document.text_lines
+        timings[name] = time.perf_counter() - start
+        documents[name] = document
+
+    reference = documents[REFERENCE_BACKEND]
+    mismatches = {}
+    for name, document in documents.items():
+        if name == REFERENCE_BACKEND:
+            continue
+        if document.text_lines != reference.text_lines or document.title != reference.title:
+            mismatches[name] = document
+    return timings, reference, mismatches
+
+
+if __name__ == "__main__":
+    # Usage: python check_parsers.py [directory-or-files ...]
+    # (defaults to html_runs/, or to the test fixtures when there are no snapshots yet)
+    targets = sys.argv[1:] or ["html_runs" if os.path.isdir("html_runs") else os.path.join("tests", "fixtures")]
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            paths.extend(sorted(glob.glob(os.path.join(target, "*.html"))))
+        else:
+            paths.append(target)
+
+    backends = list(BACKENDS)
+    totals = {name: 0.0 for name in backends}
+    failures = 0
+    for path in paths:
+        timings, reference, mismatches = compare_file(path, backends)
+        for name, elapsed in timings.items():
+            totals[name] += elapsed
+        for name, document in mismatches.items():
+            failures += 1
+            print(f"MISMATCH {path} [{name}]")
+            if document.title != reference.title:
+                print(f"  title: {reference.title!r} != {document.title!r}")
+            diff = difflib.unified_diff(reference.text_lines, document.text_lines, REFERENCE_BACKEND, name, n=1, lineterm="")
+            for line in list(diff)[:20]:
+                print(f"  {line}")
+
+    print(f"Checked {len(paths)} pages, {failures} mismatches")
+    for name, total in totals.items():
+        print(f"  {name}: {total:.3f}s")
+    sys.exit(1 if failures else 0)
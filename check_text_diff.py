@@ -0,0 +1,94 @@
+import glob
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from document import ParsedDocument
+from git_engine import generate_diff
+from storage import read_text
+
+
+def edited(text, seed):
+    """A copy of text with a few lines changed, inserted, deleted and re-spaced."""
+    rng = random.Random(seed)
+    lines = text.split("\n")
+    for _ in range(max(1, len(lines) // 50)):
+        position = rng.randrange(len(lines))
+        roll = rng.random()
+        if roll < 0.4:
+            lines[position] = lines[position] + " (updated)"
+        elif roll < 0.6:
+            lines.insert(position, "New line added")
+        elif roll < 0.8:
+            del lines[position]
+        else:
+            # Only differs after NFKC normalisation, so both backends must drop it.
+            lines[position] = " " + lines[position].replace(" ", "\u00a0") + " "
+        if not lines:
+            lines.append("")
+    return "\n".join(lines)
+
+
+def compare(old_text, new_text, timings):
+    """Returns (identical, same_lines, outputs); same_lines means the same +/- lines in a different order."""
+    results = {}
+    for backend in ("git", "python"):
+        start = time.perf_counter()
+        results[backend] = generate_diff(old_text, new_text, backend=backend)
+        timings[backend] += time.perf_counter() - start
+    identical = results["git"] == results["python"]
+    same_lines = Counter(results["git"].split("\n")) == Counter(results["python"].split("\n"))
+    return identical, same_lines, results
+
+
+if __name__ == "__main__":
+    # Usage: python check_text_diff.py [directory-or-files ...]
+    # (defaults to html_runs/, or to the test fixtures when there are no snapshots yet)
+    # Diffs each page's text against an edited copy, and each page against the next one,
+    # with both TEXT_DIFF_BACKEND implementations.
+    targets = sys.argv[1:] or ["html_runs" if os.path.isdir("html_runs") else os.path.join("tests", "fixtures")]
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            paths.extend(sorted(glob.glob(os.path.join(target, "*.html"))))
+        else:
+            paths.append(target)
+
+    texts = []
+    for path in paths:
+        texts.append((path, ParsedDocument(read_text(path, errors="replace")).text))
+
+    # Edited copies model a page changing between runs: both backends must report the same
+    # lines. Changes are slid into place the way git does it, but among repeated lines git's
+    # own diff can still pick another, equally short, alignment and so list the same lines in
+    # another order; unrelated pages have many such alignments. Those are reported as aligned
+    # differently but not counted as failures.
+    cases = [(path, text, edited(text, index), True) for index, (path, text) in enumerate(texts)]
+    cases += [(f"{texts[index][0]} -> {texts[index + 1][0]}", texts[index][1], texts[index + 1][1], False) for index in range(len(texts) - 1)]
+
+    timings = {True: {"git": 0.0, "python": 0.0}, False: {"git": 0.0, "python": 0.0}}
+    identical_count = 0
+    realigned = 0
+    failures = 0
+    for name, old_text, new_text, strict in cases:
+        identical, same_lines, results = compare(old_text, new_text, timings[strict])
+        if identical:
+            identical_count += 1
+        elif same_lines or not strict:
+            realigned += 1
+        else:
+            failures += 1
+            print(f"MISMATCH {name}")
+            git_lines = Counter(results["git"].split("\n"))
+            python_lines = Counter(results["python"].split("\n"))
+            for line in list((git_lines - python_lines).elements())[:10]:
+                print(f"  git only:    {line}")
+            for line in list((python_lines - git_lines).elements())[:10]:
+                print(f"  python only: {line}")
+
+    print(f"Checked {len(cases)} diffs: {identical_count} identical, {realigned} aligned differently, {failures} mismatches")
+    for strict, label in ((True, "edited copies"), (False, "page to page")):
+        print(f"  {label}: " + ", ".join(f"{backend} {total:.3f}s" for backend, total in timings[strict].items()))
+    sys.exit(1 if failures else 0)
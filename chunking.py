@@ -0,0 +1,108 @@
+import os
+from typing import Callable, Dict, List, Optional
+
+from rate_limit import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Largest share of a diff, in tokens, sent in one summary prompt. Bigger diffs
+# are split into parts that are summarised separately and then merged.
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "6000"))
+
+_encodings: Dict[str, Optional[object]] = {}
+
+
+def _encoding(model: str):
+    if model not in _encodings:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # e.g. the encoding files cannot be downloaded; fall back to the estimate.
+            encoding = None
+        _encodings[model] = encoding
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Tokens in text for the given model, using tiktoken when it is installed and an estimate otherwise."""
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _is_removal(line: str) -> bool:
+    return line.startswith("-") or line.startswith("<del")
+
+
+def diff_hunks(diff_text: str) -> List[str]:
+    """
+    Splits a diff into hunks: runs of changed lines where a new hunk starts
+    at each removal that follows an addition, so a line's old and new
+    versions stay together. Works for +/- text diffs and <del>/<ins> diffs.
+    """
+    hunks: List[List[str]] = []
+    previous_removal = False
+    for line in diff_text.split("\n"):
+        removal = _is_removal(line)
+        if not hunks or (removal and not previous_removal):
+            hunks.append([])
+        hunks[-1].append(line)
+        previous_removal = removal
+    return ["\n".join(hunk) for hunk in hunks]
+
+
+def _split_oversized(text: str, budget: int, count: Callable[[str], int]) -> List[str]:
+    """Splits a single item larger than the budget on line boundaries, or on characters for one huge line."""
+    pieces: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in text.split("\n"):
+        tokens = count(line) + 1
+        if tokens > budget:
+            if current:
+                pieces.append("\n".join(current))
+                current, size = [], 0
+            # Characters per token of this line, to cut it into budget-sized slices.
+            step = max(1, len(line) * budget // tokens)
+            pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+            continue
+        if current and size + tokens > budget:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def pack_chunks(items: List[str], budget: int, count: Callable[[str], int], min_items: int = 1) -> List[str]:
+    """
+    Packs items, in order, into chunks of at most budget tokens, joined by
+    newlines. An item too big for a chunk of its own is split. Each chunk
+    takes at least min_items items while there are that many left, which
+    guarantees a reduce step always shrinks the number of chunks.
+    """
+    chunks: List[List[str]] = []
+    size = 0
+    for item in items:
+        tokens = count(item) + 1
+        if tokens > budget and min_items == 1:
+            chunks.extend([piece] for piece in _split_oversized(item, budget, count))
+            size = budget
+            continue
+        if not chunks or (size + tokens > budget and len(chunks[-1]) >= min_items):
+            chunks.append([])
+            size = 0
+        chunks[-1].append(item)
+        size += tokens
+    if len(chunks) > 1 and len(chunks[-1]) < min_items:
+        chunks[-2].extend(chunks.pop())
+    return ["\n".join(chunk) for chunk in chunks]
@@ -0,0 +1,181 @@
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from document import ParsedDocument, StoredDocument
+from extraction import BoilerplateRules
+from git_engine import generate_diff
+from noise import NoiseFilter
+from parsers import NODES_DATA_VERSION, get_backend
+from tree_diff import highlight_trees
+from utils import (
+    extract_body_content,
+    fingerprint,
+    highlight_lines,
+)
+
+DIFF_WORKERS = int(os.environ.get("DIFF_WORKERS", "0"))
+# "line" diffs the prettified lines of both pages; "tree" diffs their DOM trees.
+HTML_DIFF_ENGINE = os.environ.get("HTML_DIFF_ENGINE", "line").lower()
+# Show changed text lines in differences/ with word-level highlighting.
+INLINE_WORD_DIFF = os.environ.get("INLINE_WORD_DIFF", "0").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class Comparison:
+    """
+    Compact result of comparing a freshly fetched page with its baseline.
+    Only plain strings cross the process boundary, never parsed documents.
+    """
+    latest_html: Optional[str] = None
+    fingerprint: Dict[str, str] = field(default_factory=dict)
+    unchanged: bool = False
+    needs_baseline: bool = False
+    text_unchanged: bool = False
+    git_difference: str = ""
+    diff_html: str = ""
+    raw_diff_html: str = ""
+    summary_input: str = ""
+    views: Optional[Dict] = None
+
+
+def views_signature(rules: Optional[BoilerplateRules] = None) -> str:
+    """
+    Identifies the settings that stored baseline views depend on, so views
+    saved under a different parser backend, diff engine or set of
+    boilerplate rules, or in an older node tree format, are not reused.
+    """
+    engine = f"tree{NODES_DATA_VERSION}" if HTML_DIFF_ENGINE == "tree" else HTML_DIFF_ENGINE
+    return f"{get_backend().name}|{engine}|{rules.signature if rules else 'off'}"
+
+
+def compare_page(
+    html: Optional[str],
+    old_html: Optional[str],
+    old_fingerprint: Optional[Dict[str, str]],
+    rules: Optional[BoilerplateRules] = None,
+    noise: Optional[NoiseFilter] = None,
+) -> Comparison:
+    """
+    Runs the CPU-bound clean -> extract text -> git diff -> highlight -> filter
+    stage for one link.
+
+    With no baseline at all (first run), the cleaned page is returned as
+    unchanged so the caller can store it. When only the baseline's
+    fingerprint was supplied and it does not match, needs_baseline is set
+    and the caller must pass the result to compare_baseline together with
+    the baseline's stored views, or its HTML if it has none.
+
+    Boilerplate matching rules is pruned from both sides before the text
+    and HTML diffs, while the returned latest_html stays the full page.
+    Lines matching the noise rules are masked or dropped on both sides
+    before diffing, so they never show up as changes, and noise is masked
+    in the markup before it is fingerprinted. Whenever latest_html
+    is returned, its views (see views_signature) are returned too, to be
+    stored with it.
+    """
+    if not html:
+        return Comparison()
+    latest = ParsedDocument(html)
+    latest_html = latest.cleaned_markup
+    if not latest_html:
+        return Comparison()
+    latest_fingerprint = {"markup": _markup_fingerprint(latest_html, noise)}
+
+    if old_html is None and old_fingerprint is None:
+        views = _latest_views(latest, rules, noise, latest_fingerprint)
+        return Comparison(latest_html=latest_html, fingerprint=latest_fingerprint, unchanged=True, views=views)
+    if old_fingerprint is None:
+        old_fingerprint = {"markup": _markup_fingerprint(old_html, noise)}
+    if old_fingerprint.get("markup") == latest_fingerprint["markup"]:
+        return Comparison(fingerprint=latest_fingerprint, unchanged=True)
+
+    # Materialise the views each side needs and drop its tree before parsing the
+    # other, so only one parse tree is alive at a time.
+    views = _latest_views(latest, rules, noise, latest_fingerprint)
+    result = Comparison(latest_html=latest_html, fingerprint=latest_fingerprint, views=views)
+    if old_html is None:
+        result.needs_baseline = True
+        return result
+    return _diff_documents(result, latest, _baseline(old_html, None, rules), old_fingerprint, noise)
+
+
+def compare_baseline(
+    comparison: Comparison,
+    old_html: Optional[str],
+    old_views: Optional[Dict],
+    old_fingerprint: Dict[str, str],
+    rules: Optional[BoilerplateRules] = None,
+    noise: Optional[NoiseFilter] = None,
+) -> Comparison:
+    """
+    Finishes a needs_baseline result of compare_page. The latest page is
+    restored from the views in the result rather than parsed again, and the
+    baseline from its stored views when there are any.
+    """
+    result = Comparison(latest_html=comparison.latest_html, fingerprint=comparison.fingerprint, views=comparison.views)
+    return _diff_documents(result, StoredDocument(comparison.views), _baseline(old_html, old_views, rules), old_fingerprint, noise)
+
+
+def _baseline(old_html: Optional[str], old_views: Optional[Dict], rules: Optional[BoilerplateRules]):
+    if old_views is not None:
+        return StoredDocument(old_views)
+    old = ParsedDocument(old_html)
+    old.prune(rules)
+    old.warm(include_nodes=HTML_DIFF_ENGINE == "tree")
+    old.release()
+    return old
+
+
+def _diff_documents(result: Comparison, latest, old, old_fingerprint: Dict[str, str], noise: Optional[NoiseFilter]) -> Comparison:
+    if old_fingerprint.get("text") == result.fingerprint["text"]:
+        result.text_unchanged = True
+    else:
+        result.git_difference = generate_diff(old.text, latest.text, noise=noise)
+
+    if HTML_DIFF_ENGINE == "tree":
+        old_nodes, latest_nodes = old.nodes, latest.nodes
+        if noise:
+            old_nodes, latest_nodes = noise.filter_nodes(old_nodes), noise.filter_nodes(latest_nodes)
+        result.diff_html, result.raw_diff_html = highlight_trees(old_nodes, latest_nodes, INLINE_WORD_DIFF)
+    else:
+        result.diff_html, result.raw_diff_html = highlight_lines(old.prettified_lines, latest.prettified_lines, INLINE_WORD_DIFF, noise)
+    if result.raw_diff_html.strip():
+        result.summary_input = str(extract_body_content(result.raw_diff_html))
+    return result
+
+
+def _markup_fingerprint(markup: str, noise: Optional[NoiseFilter]) -> str:
+    """Fingerprint of the cleaned markup with noise masked, so a page whose only change is a nonce or timestamp still matches."""
+    return fingerprint(noise.normalise_markup(markup) if noise else markup)
+
+
+def _latest_views(latest: ParsedDocument, rules: Optional[BoilerplateRules], noise: Optional[NoiseFilter], latest_fingerprint: Dict[str, str]) -> Dict:
+    """Prunes the latest page, computes the views the diff and the next run need, and drops its tree."""
+    latest.prune(rules)
+    views = latest.views(include_nodes=HTML_DIFF_ENGINE == "tree")
+    views["signature"] = views_signature(rules)
+    latest.release()
+    latest_text = noise.normalise_text(latest.text) if noise else latest.text
+    latest_fingerprint["text"] = fingerprint(latest_text)
+    return views
+
+
+class InlineExecutor(Executor):
+    """Executor that runs each task immediately in the calling process."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def get_executor(workers: int = DIFF_WORKERS) -> Executor:
+    """Returns a process pool of the given size, or an inline executor when workers <= 1."""
+    if workers and workers > 1:
+        return ProcessPoolExecutor(max_workers=workers)
+    return InlineExecutor()
@@ -0,0 +1,100 @@
+from functools import cached_property
+from typing import Dict, List, Optional
+
+from parsers import Node, get_backend, nodes_from_data, nodes_to_data
+
+
+class ParsedDocument:
+    """
+    An HTML page parsed and cleaned exactly once.
+
+    Every view the pipeline needs (cleaned markup, prettified lines, node
+    tree, plain text lines, title) is derived lazily from the same tree and cached, so
+    no stage has to parse the page again. The tree is built by the
+    configured parser backend (see parsers.py).
+    """
+
+    def __init__(self, html: str, backend: Optional[str] = None):
+        self.backend = get_backend(backend)
+        self.root = self.backend.parse(html)
+
+    @cached_property
+    def cleaned_markup(self) -> str:
+        return self.backend.markup(self.root)
+
+    @cached_property
+    def prettified_lines(self) -> List[str]:
+        return self.backend.prettified_lines(self.root)
+
+    @cached_property
+    def nodes(self) -> List[Node]:
+        """Parser-neutral node tree with subtree hashes, for the structural diff."""
+        return self.backend.nodes(self.root)
+
+    @cached_property
+    def text_lines(self) -> List[str]:
+        """Stripped, non-empty text of <body>, skipping scripts, styles and page chrome."""
+        return self.backend.text_lines(self.root)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.text_lines)
+
+    @cached_property
+    def title(self) -> Optional[str]:
+        return self.backend.title(self.root)
+
+    def prune(self, rules) -> int:
+        """
+        Removes boilerplate subtrees (see extraction.BoilerplateRules) from the
+        tree. Views computed afterwards describe the main content only, while
+        views already computed, such as the cleaned markup that gets stored,
+        are left untouched.
+        """
+        if not rules or not rules.enabled:
+            return 0
+        return self.backend.prune(self.root, rules.skip_tags, rules.compiled_pattern)
+
+    def views(self, include_nodes: bool = False) -> Dict:
+        """
+        The views a later comparison needs from this page as a baseline, in
+        a JSON-ready form that StoredDocument loads without parsing.
+        """
+        title = self.title
+        # A bs4 title is a NavigableString, which would pickle its whole tree.
+        views = {"text_lines": self.text_lines, "title": str(title) if title is not None else None}
+        if include_nodes:
+            views["nodes"] = nodes_to_data(self.nodes)
+        else:
+            views["prettified_lines"] = self.prettified_lines
+        return views
+
+    def warm(self, include_nodes: bool = False) -> None:
+        """
+        Computes the views a comparison reads from a baseline (the same ones
+        views() stores), so they survive release().
+        """
+        for name in ("text_lines", "nodes" if include_nodes else "prettified_lines"):
+            getattr(self, name)
+
+    def release(self) -> None:
+        """Drops the parse tree, keeping only the views computed so far."""
+        self.root = None
+
+
+class StoredDocument:
+    """
+    A baseline page restored from the views saved with its snapshot (see
+    ParsedDocument.views), standing in for a ParsedDocument that has
+    already been pruned and released.
+    """
+
+    def __init__(self, views: Dict):
+        self.prettified_lines: Optional[List[str]] = views.get("prettified_lines")
+        self.text_lines: List[str] = views["text_lines"]
+        self.title: Optional[str] = views.get("title")
+        self.nodes: Optional[List[Node]] = nodes_from_data(views["nodes"]) if "nodes" in views else None
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.text_lines)
@@ -0,0 +1,53 @@
+import os
+import re
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import FrozenSet, Optional
+
+from model import BOILERPLATE_CLASS_OR_ID, SKIP_TAGS
+
+BOILERPLATE_PRUNING = os.environ.get("BOILERPLATE_PRUNING", "1").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class BoilerplateRules:
+    """
+    Which subtrees to prune before two versions of a page are compared:
+    any element whose tag is in skip_tags, or whose class or id matches
+    class_or_id (a case-insensitive regex).
+    """
+    enabled: bool = True
+    skip_tags: FrozenSet[str] = field(default_factory=lambda: frozenset(SKIP_TAGS))
+    class_or_id: Optional[str] = BOILERPLATE_CLASS_OR_ID.pattern
+
+    @cached_property
+    def compiled_pattern(self) -> Optional[re.Pattern]:
+        return re.compile(self.class_or_id, re.I) if self.class_or_id else None
+
+    @property
+    def signature(self) -> str:
+        """Stable description of the rules, used to tell whether stored views are still valid."""
+        if not self.enabled:
+            return "off"
+        return f"{','.join(sorted(self.skip_tags))}|{self.class_or_id or ''}"
+
+
+def boilerplate_rules(site_config: Optional[dict]) -> BoilerplateRules:
+    """
+    Resolves the pruning rules for one monitored site from its urls.json entry.
+
+    "boilerplate": false disables pruning for the site; an object may
+    override "skip_tags" (list of tag names) and/or "class_or_id" (regex,
+    or null to match on tag names only). Sites without the key use the
+    defaults from model.py, unless BOILERPLATE_PRUNING is turned off.
+    """
+    setting = (site_config or {}).get("boilerplate", BOILERPLATE_PRUNING)
+    if not setting:
+        return BoilerplateRules(enabled=False)
+    rules = BoilerplateRules()
+    if isinstance(setting, dict):
+        if "skip_tags" in setting:
+            rules.skip_tags = frozenset(tag.lower() for tag in setting["skip_tags"])
+        if "class_or_id" in setting:
+            rules.class_or_id = setting["class_or_id"]
+    return rules
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from streaming import StreamingPage, sniff_charset
+
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", "16"))
+FETCH_PER_HOST = int(os.environ.get("FETCH_PER_HOST", "4"))
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "30"))
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", "3"))
+FETCH_BACKOFF = float(os.environ.get("FETCH_BACKOFF", "0.5"))
+FETCH_CHUNK_SIZE = 64 * 1024
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", str(20 * 1024 * 1024)))
+STREAMING_CLEAN = os.environ.get("STREAMING_CLEAN", "0").lower() in ("1", "true", "yes")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_DONE = object()
+
+
+class BodyTooLarge(Exception):
+    """Raised when a response body exceeds MAX_BODY_BYTES."""
+
+
+@dataclass
+class FetchResult:
+    """Outcome of fetching one monitored page."""
+    key: str
+    url: str
+    text: Optional[str] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+
+    @property
+    def validators(self) -> Dict[str, object]:
+        """Cache validators to send back on the next conditional request."""
+        return {
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_length": self.content_length,
+        }
+
+
+def conditional_headers(validators: Optional[Dict[str, object]]) -> Dict[str, str]:
+    """Build If-None-Match / If-Modified-Since headers from stored validators."""
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+class FetchSlots:
+    """
+    Limits requests in flight, overall and per host. A request's timeout
+    starts once it holds its slots, so pages queued behind others for the
+    same host do not time out before they are sent.
+    """
+
+    def __init__(self, concurrency: int = FETCH_CONCURRENCY, per_host: int = FETCH_PER_HOST):
+        self.total = asyncio.Semaphore(max(1, concurrency))
+        self.per_host = max(1, per_host)
+        self.hosts: Dict[str, asyncio.Semaphore] = {}
+
+    def host(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self.hosts:
+            self.hosts[host] = asyncio.Semaphore(self.per_host)
+        return self.hosts[host]
+
+
+async def _read_body(response: aiohttp.ClientResponse, url: str) -> str:
+    """
+    Reads a response body in chunks, enforcing MAX_BODY_BYTES.
+
+    In streaming mode each chunk is decoded and cleaned as it arrives and
+    only the cleaned markup is kept; otherwise the decoded raw page is
+    returned.
+    """
+    if response.content_length and response.content_length > MAX_BODY_BYTES:
+        raise BodyTooLarge(f"{url} declares {response.content_length} bytes, limit is {MAX_BODY_BYTES}")
+
+    page = StreamingPage(charset=response.charset) if STREAMING_CLEAN else None
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise BodyTooLarge(f"{url} exceeded {MAX_BODY_BYTES} bytes")
+        if page is not None:
+            page.feed(chunk)
+        else:
+            chunks.append(chunk)
+
+    if page is not None:
+        return page.close()
+    body = b"".join(chunks)
+    return body.decode(sniff_charset(body, declared=response.charset), errors="replace")
+
+
+async def _fetch_one(session: aiohttp.ClientSession, slots: FetchSlots, key: str, url: str, headers: Dict[str, str], logger) -> FetchResult:
+    """Fetch a single URL, retrying transient failures with exponential backoff."""
+    attempt = 0
+    timeout = aiohttp.ClientTimeout(total=FETCH_TIMEOUT)
+    while True:
+        try:
+            # Slots are held for one attempt only, not during the backoff sleep.
+            async with slots.host(url), slots.total, session.get(url, headers=headers, timeout=timeout) as response:
+                if response.status == 304:
+                    logger.info(f"Not modified since last run: {url}")
+                    return FetchResult(key=key, url=url, status=304, not_modified=True,
+                                       etag=response.headers.get("ETag"),
+                                       last_modified=response.headers.get("Last-Modified"))
+                if response.status in RETRY_STATUSES and attempt < FETCH_RETRIES:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history,
+                        status=response.status, message=response.reason or "",
+                    )
+                response.raise_for_status()
+                text = await _read_body(response, url)
+                logger.info(f"Successfully downloaded HTML from {url}")
+                return FetchResult(key=key, url=url, text=text, status=response.status,
+                                   etag=response.headers.get("ETag"),
+                                   last_modified=response.headers.get("Last-Modified"),
+                                   content_length=response.content_length)
+        except BodyTooLarge as e:
+            logger.error(f"Skipping oversized page: {str(e)}")
+            return FetchResult(key=key, url=url, status=response.status, error=str(e))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = getattr(e, "status", None)
+            retryable = status is None or status in RETRY_STATUSES
+            if not retryable or attempt >= FETCH_RETRIES:
+                logger.error(f"Failed to download HTML from {url}: {str(e) or type(e).__name__}")
+                return FetchResult(key=key, url=url, status=status, error=str(e) or type(e).__name__)
+            delay = FETCH_BACKOFF * (2 ** attempt) * (1 + random.random())
+            attempt += 1
+            logger.warning(f"Retrying {url} in {delay:.2f}s (attempt {attempt}/{FETCH_RETRIES}): {str(e) or type(e).__name__}")
+            await asyncio.sleep(delay)
+
+
+async def _fetch_all(pages: Dict[str, str], validators: Dict[str, dict], results: "queue.Queue", logger) -> None:
+    """Fetch every page over one pooled session, pushing results as they complete."""
+    connector = aiohttp.TCPConnector(limit=FETCH_CONCURRENCY, limit_per_host=FETCH_PER_HOST)
+    slots = FetchSlots()
+    # No session-wide timeout: its clock would also run while waiting for a pooled connection.
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        tasks = [
+            asyncio.ensure_future(_fetch_one(session, slots, key, url, conditional_headers(validators.get(key)), logger))
+            for key, url in pages.items()
+        ]
+        for future in asyncio.as_completed(tasks):
+            results.put(await future)
+
+
+def iter_fetch(pages: Dict[str, str], logger, validators: Optional[Dict[str, dict]] = None) -> Iterator[FetchResult]:
+    """
+    Download all pages concurrently and yield a FetchResult for each one
+    in completion order, so callers can start processing before the
+    slowest page has arrived.
+
+    When validators are given for a key, the request is made conditional
+    and an unchanged page comes back with not_modified set and no body.
+    """
+    validators = validators or {}
+    results: "queue.Queue" = queue.Queue()
+
+    def run():
+        try:
+            asyncio.run(_fetch_all(pages, validators, results, logger))
+        except Exception as e:
+            logger.error(f"Fetch stage failed: {str(e)}")
+        finally:
+            results.put(_DONE)
+
+    logger.info(f"Fetching {len(pages)} pages (concurrency={FETCH_CONCURRENCY}, per_host={FETCH_PER_HOST})")
+    threading.Thread(target=run, name="fetch-stage", daemon=True).start()
+    while True:
+        result = results.get()
+        if result is _DONE:
+            return
+        yield result
@@ -1,20 +1,255 @@
+import os
 import subprocess
 import tempfile
 import unicodedata
+from typing import List, Sequence, Tuple
+
+from line_diff import line_opcodes
+
+# "python" diffs in-process; "git" forks `git diff --no-index` as before.
+TEXT_DIFF_BACKEND = os.environ.get("TEXT_DIFF_BACKEND", "python").lower()
 
 def normalize_line(line: str) -> str:
     return unicodedata.normalize("NFKC", line.strip())
 
-def generate_diff(old_text: str, new_text: str) -> str:
-    with tempfile.NamedTemporaryFile("w+", delete=False) as f1, \
-         tempfile.NamedTemporaryFile("w+", delete=False) as f2:
-        f1.write(old_text)
-        f2.write(new_text)
-        f1.flush()
-        f2.flush()
+def _split_lines(text: str) -> List[str]:
+    # git splits on "\n" only and does not count a trailing newline as an extra line.
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+def _terminated(text: str) -> str:
+    return text if not text or text.endswith("\n") else text + "\n"
+
+# Scoring of where to place a change that can slide, from git's indent
+# heuristic (xdiff/xdiffi.c), which `git diff` uses by default.
+MAX_INDENT = 200
+MAX_BLANKS = 20
+START_OF_FILE_PENALTY = 1
+END_OF_FILE_PENALTY = 21
+TOTAL_BLANK_WEIGHT = -30
+POST_BLANK_WEIGHT = 6
+RELATIVE_INDENT_PENALTY = -4
+RELATIVE_INDENT_WITH_BLANK_PENALTY = 10
+RELATIVE_OUTDENT_PENALTY = 24
+RELATIVE_OUTDENT_WITH_BLANK_PENALTY = 17
+RELATIVE_DEDENT_PENALTY = 23
+RELATIVE_DEDENT_WITH_BLANK_PENALTY = 17
+INDENT_WEIGHT = 60
+INDENT_HEURISTIC_MAX_SLIDING = 100
+
+def _indent(line: str) -> int:
+    """Width of a line's indentation, or -1 for a blank line."""
+    width = 0
+    for char in line:
+        if not char.isspace():
+            return width
+        if char == " ":
+            width += 1
+        elif char == "\t":
+            width += 8 - width % 8
+        if width >= MAX_INDENT:
+            return MAX_INDENT
+    return -1
+
+def _split_score(lines: List[str], split: int) -> Tuple[int, int]:
+    """(effective indent, penalty) of placing a change boundary just before lines[split]."""
+    indent = _indent(lines[split]) if split < len(lines) else -1
+    pre_blank, pre_indent = 0, -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = _indent(lines[i])
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == MAX_BLANKS:
+            pre_indent = 0
+            break
+    post_blank, post_indent = 0, -1
+    for i in range(split + 1, len(lines)):
+        post_indent = _indent(lines[i])
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == MAX_BLANKS:
+            post_indent = 0
+            break
+
+    penalty = 0
+    if pre_indent == -1 and pre_blank == 0:
+        penalty += START_OF_FILE_PENALTY
+    if split >= len(lines):
+        penalty += END_OF_FILE_PENALTY
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+    penalty += TOTAL_BLANK_WEIGHT * total_blank + POST_BLANK_WEIGHT * post_blank
+    if indent == -1:
+        indent = post_indent
+    if indent != -1 and pre_indent != -1:
+        if indent > pre_indent:
+            penalty += RELATIVE_INDENT_WITH_BLANK_PENALTY if total_blank else RELATIVE_INDENT_PENALTY
+        elif indent < pre_indent:
+            if post_indent != -1 and post_indent > indent:
+                penalty += RELATIVE_OUTDENT_WITH_BLANK_PENALTY if total_blank else RELATIVE_OUTDENT_PENALTY
+            else:
+                penalty += RELATIVE_DEDENT_WITH_BLANK_PENALTY if total_blank else RELATIVE_DEDENT_PENALTY
+    return indent, penalty
+
+def _shift_score(lines: List[str], shift: int, size: int) -> int:
+    """Score of a change of size lines ending before lines[shift]; lower is better."""
+    end_indent, end_penalty = _split_score(lines, shift)
+    start_indent, start_penalty = _split_score(lines, shift - size)
+    return INDENT_WEIGHT * (end_indent + start_indent) + end_penalty + start_penalty
+
+class _Groups:
+    """
+    Runs of changed lines in one file, walked in step with the other file's
+    (xdiff's struct xdlgroup). changed has a False sentinel at the end,
+    which also serves as changed[-1].
+    """
+
+    def __init__(self, keys: Sequence, changed: List[bool]):
+        self.keys = keys
+        self.changed = changed
+        self.start = self.end = 0
+        while changed[self.end]:
+            self.end += 1
+
+    def next(self) -> bool:
+        if self.end == len(self.keys):
+            return False
+        self.start = self.end = self.end + 1
+        while self.changed[self.end]:
+            self.end += 1
+        return True
+
+    def previous(self) -> bool:
+        if self.start == 0:
+            return False
+        self.start = self.end = self.start - 1
+        while self.changed[self.start - 1]:
+            self.start -= 1
+        return True
+
+    def slide_down(self) -> bool:
+        if self.end < len(self.keys) and self.keys[self.start] == self.keys[self.end]:
+            self.changed[self.start] = False
+            self.changed[self.end] = True
+            self.start += 1
+            self.end += 1
+            while self.changed[self.end]:
+                self.end += 1
+            return True
+        return False
+
+    def slide_up(self) -> bool:
+        if self.start > 0 and self.keys[self.start - 1] == self.keys[self.end - 1]:
+            self.start -= 1
+            self.end -= 1
+            self.changed[self.start] = True
+            self.changed[self.end] = False
+            while self.changed[self.start - 1]:
+                self.start -= 1
+            return True
+        return False
+
+def _compact(keys: Sequence, changed: List[bool], other_keys: Sequence, other_changed: List[bool]) -> None:
+    """
+    Slides each run of changed lines in one file to where git would show it
+    (xdl_change_compact): merged with neighbouring runs where possible, then
+    lined up with a change in the other file, or else placed by the indent
+    heuristic.
+    """
+    g = _Groups(keys, changed)
+    go = _Groups(other_keys, other_changed)
+    while True:
+        if g.end != g.start:
+            while True:
+                size = g.end - g.start
+                end_matching_other = -1
+                while g.slide_up():
+                    go.previous()
+                earliest_end = g.end
+                if go.end > go.start:
+                    end_matching_other = g.end
+                while g.slide_down():
+                    go.next()
+                    if go.end > go.start:
+                        end_matching_other = g.end
+                if size == g.end - g.start:
+                    break
+            if g.end == earliest_end:
+                pass
+            elif end_matching_other != -1:
+                while go.end == go.start:
+                    g.slide_up()
+                    go.previous()
+            else:
+                shift = max(earliest_end, g.end - size - 1, g.end - INDENT_HEURISTIC_MAX_SLIDING)
+                best_shift, best_score = -1, 0
+                for shift in range(shift, g.end + 1):
+                    score = _shift_score(keys, shift, size)
+                    if best_shift == -1 or score <= best_score:
+                        best_shift, best_score = shift, score
+                while g.end > best_shift:
+                    g.slide_up()
+                    go.previous()
+        if not g.next():
+            break
+        go.next()
+
+def python_changes(old_text: str, new_text: str, noise=None) -> List[str]:
+    """
+    +/- lines in the order git prints them: changed runs are placed where
+    git would place them when a repeated line lets them slide, and each
+    change lists its removed lines, then its added lines. With a
+    noise.NoiseFilter, lines are matched on their noise-masked keys and
+    dropped noise is left out.
+    """
+    old_lines = _split_lines(old_text)
+    new_lines = _split_lines(new_text)
+    if noise is not None:
+        old_lines, old_keys = noise.apply(old_lines)
+        new_lines, new_keys = noise.apply(new_lines)
+    else:
+        old_keys, new_keys = old_lines, new_lines
+    old_changed = [True] * len(old_keys) + [False]
+    new_changed = [True] * len(new_keys) + [False]
+    for tag, i1, i2, j1, j2 in line_opcodes(old_keys, new_keys):
+        if tag == "equal":
+            old_changed[i1:i2] = [False] * (i2 - i1)
+            new_changed[j1:j2] = [False] * (j2 - j1)
+    _compact(old_keys, old_changed, new_keys, new_changed)
+    _compact(new_keys, new_changed, old_keys, old_changed)
+
+    raw_changes = []
+    i = j = 0
+    while i < len(old_lines) or j < len(new_lines):
+        if not old_changed[i] and not new_changed[j]:
+            i += 1
+            j += 1
+            continue
+        while old_changed[i]:
+            raw_changes.append("-" + old_lines[i])
+            i += 1
+        while new_changed[j]:
+            raw_changes.append("+" + new_lines[j])
+            j += 1
+    return raw_changes
+
+def git_changes(old_text: str, new_text: str) -> List[str]:
+    """+/- lines from `git diff --no-index` on two temporary files."""
+    with tempfile.TemporaryDirectory() as directory:
+        old_path = os.path.join(directory, "old")
+        new_path = os.path.join(directory, "new")
+        with open(old_path, "w", encoding="utf-8", newline="\n") as f1, open(new_path, "w", encoding="utf-8", newline="\n") as f2:
+            # End both files with a newline, as _split_lines assumes, so git does not report the
+            # last line as changed ("\ No newline at end of file") when only one text has one.
+            f1.write(_terminated(old_text))
+            f2.write(_terminated(new_text))
 
         result = subprocess.run(
-            ["git", "diff", "--no-index", f1.name, f2.name],
+            ["git", "diff", "--no-index", old_path, new_path],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True
@@ -26,6 +261,24 @@ def generate_diff(old_text: str, new_text: str) -> str:
             raw_changes.append(line)
         elif line.startswith("-") and not line.startswith("---"):
             raw_changes.append(line)
+    return raw_changes
+
+def generate_diff(old_text: str, new_text: str, backend: str = None, noise=None) -> str:
+    """
+    Returns the added (+) and removed (-) lines between two texts, leaving
+    out -/+ pairs that only differ in whitespace or Unicode form (NFKC).
+
+    Noise rules are applied before diffing. git only sees the normalised
+    text, so with the git backend masked lines are reported in their
+    masked form.
+    """
+    if (backend or TEXT_DIFF_BACKEND) == "git":
+        if noise is not None:
+            old_text = noise.normalise_text(old_text)
+            new_text = noise.normalise_text(new_text)
+        raw_changes = git_changes(old_text, new_text)
+    else:
+        raw_changes = python_changes(old_text, new_text, noise)
 
     filtered = []
     i = 0
@@ -0,0 +1,217 @@
+from bisect import bisect_left
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# Largest edit distance the Myers fallback will search for inside a region
+# that has no unique common lines; beyond it the region becomes one replace.
+MAX_MYERS_EDITS = 200
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def intern_lines(a: Sequence[Hashable], b: Sequence[Hashable]) -> Tuple[List[int], List[int]]:
+    """Maps every distinct line to a small integer so comparisons are int compares."""
+    ids: Dict[Hashable, int] = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b]
+    return a_ids, b_ids
+
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Longest chain of (i, j) pairs increasing in both, given pairs sorted by i."""
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        position = bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[position] = j
+            tail_index[position] = index
+        previous[index] = tail_index[position - 1] if position else -1
+    chain = []
+    index = tail_index[-1] if tail_index else -1
+    while index != -1:
+        chain.append(pairs[index])
+        index = previous[index]
+    chain.reverse()
+    return chain
+
+
+def _myers(a: List[int], a_lo: int, a_hi: int, b: List[int], b_lo: int, b_hi: int, max_edits: int):
+    """
+    Myers' O(ND) shortest edit script for a[a_lo:a_hi] vs b[b_lo:b_hi].
+    Returns a list of ("equal" | "delete" | "insert", a_index, b_index)
+    steps, or None if the script is longer than max_edits.
+    """
+    n, m = a_hi - a_lo, b_hi - b_lo
+    if abs(n - m) > max_edits:
+        # The script needs at least |n - m| edits, so don't bother searching.
+        return None
+    limit = min(n + m, max_edits)
+    offset = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    for d in range(limit + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1 + offset] < v[k + 1 + offset]):
+                x = v[k + 1 + offset]
+            else:
+                x = v[k - 1 + offset] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            v[k + offset] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, d, n, m, offset, a_lo, b_lo)
+    return None
+
+
+def _myers_backtrack(trace, final_d: int, n: int, m: int, offset: int, a_lo: int, b_lo: int):
+    steps = []
+    x, y = n, m
+    for d in range(final_d, 0, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1 + offset] < v[k + 1 + offset]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v[previous_k + offset]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            steps.append(("equal", a_lo + x, b_lo + y))
+        if previous_k == k + 1:
+            y -= 1
+            steps.append(("insert", a_lo + x, b_lo + y))
+        else:
+            x -= 1
+            steps.append(("delete", a_lo + x, b_lo + y))
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        steps.append(("equal", a_lo + x, b_lo + y))
+    steps.reverse()
+    return steps
+
+
+def _matching_blocks(a: List[int], b: List[int], max_edits: int) -> List[Tuple[int, int, int]]:
+    """
+    Returns (i, j, size) runs of equal lines, in order, using patience-style
+    anchoring on lines that are unique in both regions and falling back to
+    a bounded Myers search where no such anchors exist.
+    """
+    blocks: List[Tuple[int, int, int]] = []
+    # Regions are processed left to right from an explicit stack.
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        if len(item) == 3:
+            # A common suffix deferred until the sub-regions before it were done.
+            blocks.append(item)
+            continue
+        a_lo, a_hi, b_lo, b_hi = item
+
+        # Trim common prefix and suffix.
+        start = 0
+        while a_lo + start < a_hi and b_lo + start < b_hi and a[a_lo + start] == b[b_lo + start]:
+            start += 1
+        if start:
+            blocks.append((a_lo, b_lo, start))
+            a_lo += start
+            b_lo += start
+        end = 0
+        while a_hi - end > a_lo and b_hi - end > b_lo and a[a_hi - end - 1] == b[b_hi - end - 1]:
+            end += 1
+        suffix = (a_hi - end, b_hi - end, end) if end else None
+        a_hi -= end
+        b_hi -= end
+
+        if a_lo < a_hi and b_lo < b_hi:
+            counts: Dict[int, List[int]] = {}
+            for i in range(a_lo, a_hi):
+                entry = counts.get(a[i])
+                if entry is None:
+                    counts[a[i]] = [1, 0, i, -1]
+                else:
+                    entry[0] += 1
+            for j in range(b_lo, b_hi):
+                entry = counts.get(b[j])
+                if entry is not None:
+                    entry[1] += 1
+                    entry[3] = j
+            pairs = sorted((entry[2], entry[3]) for entry in counts.values() if entry[0] == 1 and entry[1] == 1)
+            anchors = _longest_increasing(pairs)
+
+            if anchors:
+                sub_regions = []
+                previous_i, previous_j = a_lo, b_lo
+                for i, j in anchors:
+                    sub_regions.append((previous_i, i, previous_j, j))
+                    sub_regions.append((i, i + 1, j, j + 1))
+                    previous_i, previous_j = i + 1, j + 1
+                sub_regions.append((previous_i, a_hi, previous_j, b_hi))
+                if suffix:
+                    sub_regions.append(suffix)
+                stack.extend(reversed(sub_regions))
+                continue
+
+            steps = _myers(a, a_lo, a_hi, b, b_lo, b_hi, max_edits)
+            if steps:
+                for tag, i, j in steps:
+                    if tag == "equal":
+                        last = blocks[-1] if blocks else None
+                        if last and last[0] + last[2] == i and last[1] + last[2] == j:
+                            blocks[-1] = (last[0], last[1], last[2] + 1)
+                        else:
+                            blocks.append((i, j, 1))
+
+        if suffix:
+            stack.append(suffix)
+    return blocks
+
+
+def _merge_blocks(blocks: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    merged: List[Tuple[int, int, int]] = []
+    for i, j, size in blocks:
+        if not size:
+            continue
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            last = merged[-1]
+            merged[-1] = (last[0], last[1], last[2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def line_opcodes(a: Sequence[Hashable], b: Sequence[Hashable], max_edits: int = MAX_MYERS_EDITS) -> List[Opcode]:
+    """
+    Diffs two sequences of lines and returns difflib-style opcodes
+    ("equal" | "replace" | "delete" | "insert", i1, i2, j1, j2).
+
+    Lines are interned to integers, the common prefix and suffix are
+    trimmed, and the middle is aligned on lines that occur exactly once in
+    both versions (patience diff), recursing between anchors. Cost is close
+    to linear in the number of lines for typical page edits, unlike
+    difflib's worst-case quadratic matching.
+    """
+    a_ids, b_ids = intern_lines(a, b)
+    blocks = _merge_blocks(_matching_blocks(a_ids, b_ids, max_edits))
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for block_i, block_j, size in blocks + [(len(a_ids), len(b_ids), 0)]:
+        if i < block_i and j < block_j:
+            opcodes.append(("replace", i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(("delete", i, block_i, j, j))
+        elif j < block_j:
+            opcodes.append(("insert", i, i, j, block_j))
+        if size:
+            opcodes.append(("equal", block_i, block_i + size, block_j, block_j + size))
+        i, j = block_i + size, block_j + size
+    return opcodes
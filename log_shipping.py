@@ -0,0 +1,138 @@
+import gzip
+import logging
+import os
+import socket
+import sys
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+
+LOG_SEGMENT_PREFIX = os.environ.get("LOG_SEGMENT_PREFIX", "system_logs/")
+LOG_FLUSH_SECONDS = float(os.environ.get("LOG_FLUSH_SECONDS", "60"))
+LOG_FLUSH_BYTES = int(os.environ.get("LOG_FLUSH_BYTES", str(256 * 1024)))
+LOG_BUFFER_MAX_BYTES = int(os.environ.get("LOG_BUFFER_MAX_BYTES", str(8 * 1024 * 1024)))
+LOG_COMPRESS = os.environ.get("LOG_COMPRESS", "1").lower() in ("1", "true", "yes")
+
+
+def segment_key(prefix: str, opened: datetime, writer: str, sequence: int, compress: bool) -> str:
+    """
+    Key of one log segment, partitioned by UTC day and hour:
+    "system_logs/2024-05-01/13/130512-<host>-<pid>-000042.log.gz".
+    The writer and sequence number keep keys from concurrent processes apart.
+    """
+    suffix = ".log.gz" if compress else ".log"
+    return f"{prefix}{opened:%Y-%m-%d}/{opened:%H}/{opened:%H%M%S}-{writer}-{sequence:06d}{suffix}"
+
+
+class S3SegmentHandler(logging.Handler):
+    """
+    Ships log records to S3 as immutable segment objects. emit() only formats
+    the record and appends it to an in-memory buffer; a background thread
+    uploads the buffer as a new segment once it holds flush_bytes, or every
+    flush_seconds, so logging never waits on the network and no object is
+    ever read back or rewritten.
+
+    When uploads fall behind and the buffer reaches max_bytes, new records are
+    dropped and counted, and the next segment says how many were lost.
+    close(), which logging.shutdown() calls at exit, uploads what is left.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = LOG_SEGMENT_PREFIX, flush_seconds: float = LOG_FLUSH_SECONDS, flush_bytes: int = LOG_FLUSH_BYTES, max_bytes: int = LOG_BUFFER_MAX_BYTES, compress: bool = LOG_COMPRESS):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.flush_seconds = flush_seconds
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.writer = f"{socket.gethostname()}-{os.getpid()}"
+        self.sequence = 0
+        self.records: Deque[str] = deque()
+        self.size = 0
+        self.dropped = 0
+        # Number of segments requested by flush() and number written so far.
+        self.requested = 0
+        self.shipped = 0
+        self.closing = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="s3-log-shipper", daemon=True)
+        self.thread.start()
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            with self.condition:
+                if self.size + len(msg) > self.max_bytes:
+                    self.dropped += 1
+                    return
+                self.records.append(msg)
+                self.size += len(msg) + 1
+                if self.size >= self.flush_bytes:
+                    self.condition.notify()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self, timeout: Optional[float] = 30.0):
+        """Uploads the records buffered so far, waiting up to timeout seconds for it."""
+        with self.condition:
+            if not self.records or not self.thread.is_alive():
+                return
+            self.requested += 1
+            target = self.requested
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.shipped >= target or not self.thread.is_alive(), timeout)
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        super().close()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.closing or self.size >= self.flush_bytes or self.requested > self.shipped,
+                    self.flush_seconds,
+                )
+                records, self.records, self.size = list(self.records), deque(), 0
+                dropped, self.dropped = self.dropped, 0
+                target, closing = self.requested, self.closing
+            if dropped:
+                records.append(f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} - {self.__class__.__name__} - WARNING - {dropped} log records dropped while uploads were behind")
+            uploaded = self._upload(records) if records else True
+            with self.condition:
+                self.shipped = max(self.shipped, target)
+                self.condition.notify_all()
+                if closing:
+                    return
+                if not uploaded:
+                    # Back off before retrying, rather than spinning on a full buffer.
+                    self.condition.wait_for(lambda: self.closing, min(self.flush_seconds, 30.0))
+
+    def _upload(self, records: List[str]) -> bool:
+        self.sequence += 1
+        key = segment_key(self.prefix, datetime.now(timezone.utc), self.writer, self.sequence, self.compress)
+        body = ("\n".join(records) + "\n").encode("utf-8")
+        extra = {"ContentType": "text/plain; charset=utf-8"}
+        if self.compress:
+            body = gzip.compress(body)
+            extra = {"ContentType": "application/gzip"}
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body, **extra)
+            return True
+        except Exception as e:
+            # Not logged: that would only add to the records that failed to upload.
+            print(f"Failed to upload {len(records)} log records to S3 as {key}: {str(e)}", file=sys.stderr)
+            with self.condition:
+                # Put them back for the next segment, as far as the buffer allows.
+                for msg in reversed(records):
+                    if self.size + len(msg) > self.max_bytes:
+                        self.dropped += 1
+                        continue
+                    self.records.appendleft(msg)
+                    self.size += len(msg) + 1
+            return False
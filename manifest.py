@@ -0,0 +1,75 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+MANIFEST_PREFIX = "manifests/"
+# Artifact directories pruned to the KEEP_VERSIONS most recent files per link.
+PRUNED_KINDS = ("differences", "html_runs", "html_meta", "html_views", "summarys", "raw_diff", "summarys_chinese")
+KEEP_VERSIONS = 3
+
+
+def manifest_path(sanitised_link: str) -> str:
+    return f"{MANIFEST_PREFIX}{sanitised_link}.json"
+
+
+def artifact_kind(key: str) -> str:
+    """The artifact directory of a key: "html_runs" for "html_runs/<title>_<timestamp>.html"."""
+    return key.split("/", 1)[0]
+
+
+@dataclass
+class LinkManifest:
+    """
+    Index of one link's stored artifacts: its latest snapshot and that
+    snapshot's fingerprint, and the keys of the pruned artifact kinds, oldest
+    first. Kept as one object so finding the baseline or the files to prune
+    is a single read instead of a listing of the whole directory.
+    """
+    name: str
+    latest: Optional[str] = None
+    fingerprint: Optional[Dict] = None
+    history: Dict[str, List[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, content: str) -> "LinkManifest":
+        data = json.loads(content)
+        return cls(
+            name=data["name"],
+            latest=data.get("latest"),
+            fingerprint=data.get("fingerprint"),
+            history={kind: list(keys) for kind, keys in data.get("history", {}).items()},
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"name": self.name, "latest": self.latest, "fingerprint": self.fingerprint, "history": self.history},
+            indent=4,
+        )
+
+    def add(self, key: str) -> None:
+        kind = artifact_kind(key)
+        if kind not in PRUNED_KINDS:
+            return
+        keys = self.history.setdefault(kind, [])
+        if key in keys:
+            keys.remove(key)
+        keys.append(key)
+
+    def set_latest(self, snapshot_key: str, fingerprint: Optional[Dict]) -> None:
+        self.add(snapshot_key)
+        self.latest = snapshot_key
+        self.fingerprint = fingerprint
+
+    def forget_latest(self) -> None:
+        """Clears the latest snapshot, e.g. when it can no longer be read, so the next page becomes the baseline."""
+        self.latest = None
+        self.fingerprint = None
+
+    def expired(self, keep: int = KEEP_VERSIONS) -> List[str]:
+        """Removes and returns the keys beyond the keep most recent of each kind."""
+        removed = []
+        for kind, keys in self.history.items():
+            if len(keys) > keep:
+                removed.extend(keys[:-keep])
+                del keys[:-keep]
+        return removed
@@ -1,6 +1,17 @@
+import random
 import re
-from typing import List
+import time
+import unicodedata
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from bs4 import BeautifulSoup, NavigableString
+from openai import APIConnectionError
+
+from chunking import SUMMARY_CHUNK_TOKENS, count_tokens, diff_hunks, pack_chunks
+from rate_limit import LLM_BACKOFF, LLM_RETRIES, LLM_RETRY_STATUSES, LLM_WORKERS
+from summary_cache import cache_key
+from translation import join_sentences, normalise_sentence, split_sentences
 
 SKIP_TAGS = {"header", "footer", "nav", "aside", "script", "style"}
 BOILERPLATE_CLASS_OR_ID = re.compile(
@@ -8,31 +19,88 @@ BOILERPLATE_CLASS_OR_ID = re.compile(
     r"site-footer|menu|global-nav|mega-menu|skip-link|toolbar|wb-slc|gcweb-menu)",
     re.I,
 )
+BATCH_MARKER = re.compile(r"^<<<(\d+)>>>[ \t]*$", re.M)
 
 class ChangeSummarizer:
 
-    def __init__(self, logger, openai_client, model: str = "gpt-4o-mini"):
+    SYSTEM_PROMPT = "Be concise. Follow the user's instructions exactly."
+
+    def __init__(self, logger, openai_client, model: str = "gpt-4o-mini", cache=None, limiter=None, memory=None):
         self.logger = logger
         self.openai_client = openai_client
         self.model = model
+        # Optional summary_cache.SummaryCache; identical requests are then answered from it.
+        self.cache = cache
+        # Optional rate_limit.RateLimiter shared by every thread calling the API.
+        self.limiter = limiter
+        # Optional SummaryCache used as a translation memory of single sentences.
+        self.memory = memory
+        self.chunk_tokens = SUMMARY_CHUNK_TOKENS
+
+    @staticmethod
+    def normalise_diff(diff_text: str) -> str:
+        """Drops blank lines and trailing whitespace so trivially different diffs share a cache entry."""
+        lines = (unicodedata.normalize("NFKC", line).rstrip() for line in diff_text.strip().splitlines())
+        return "\n".join(line for line in lines if line.strip())
 
     def summarize_changes(self, diff_text: str) -> str:
+        """
+        Summarises a diff as bullet points. A diff over SUMMARY_CHUNK_TOKENS is
+        split into hunk-aligned parts that are summarised in parallel, and the
+        partial summaries are then merged into one.
+        """
+        diff_text = self.normalise_diff(diff_text)
+        if self.count_tokens(diff_text) <= self.chunk_tokens:
+            return self._call_openai(self._summary_prompt(diff_text), "summary")
 
+        chunks = pack_chunks(diff_hunks(diff_text), self.chunk_tokens, self.count_tokens)
+        self.logger.info(f"Diff is too long for one prompt, summarising it in {len(chunks)} parts")
+        partials = self._map(lambda chunk: self._call_openai(self._summary_prompt(chunk), "partial summary"), chunks)
+        return self._merge_summaries(partials)
 
-        prompt = (
-        "You are given a diff generated by git diff with '+' for additions and '-' for deletions.\n\n"
-        "Your task:\n"
-        "1. Ignore unchanged/context lines.\n"
-        "2. Rewrite changes as plain human-readable bullet points, without '+' or '-'.\n"
-        "3. If a line was removed and then added with new content, merge them into one bullet point "
-        "describing the update.\n"
-        "4. Keep the meaning strictly faithful, only rephrase for clarity.\n\n"
-        f"Diff:\n{diff_text}\n\n"
-        "Now produce the summary as bullet points:"
-    )
+    def _merge_summaries(self, partials: List[str]) -> str:
+        # Merge in rounds until the partial summaries fit in one prompt; each round at least halves them.
+        while True:
+            groups = pack_chunks(partials, self.chunk_tokens, self.count_tokens, min_items=2)
+            if len(groups) == 1:
+                return self._call_openai(self._merge_prompt(groups[0]), "merged summary")
+            self.logger.info(f"Merging {len(partials)} partial summaries in {len(groups)} groups")
+            partials = self._map(lambda group: self._call_openai(self._merge_prompt(group), "merged summary"), groups)
 
+    def _map(self, function, items: List[str]) -> List[str]:
+        # A pool of its own: this already runs on a worker of the LLM stage, whose pool may be full.
+        # Its threads only wait for the limiter's slots, which bound the requests actually open.
+        with ThreadPoolExecutor(max_workers=max(1, min(len(items), LLM_WORKERS))) as pool:
+            return list(pool.map(function, items))
 
-        return self._call_openai(prompt, "summary")
+    def count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    @staticmethod
+    def _summary_prompt(diff_text: str) -> str:
+        return (
+            "You are given a diff generated by git diff with '+' for additions and '-' for deletions.\n\n"
+            "Your task:\n"
+            "1. Ignore unchanged/context lines.\n"
+            "2. Rewrite changes as plain human-readable bullet points, without '+' or '-'.\n"
+            "3. If a line was removed and then added with new content, merge them into one bullet point "
+            "describing the update.\n"
+            "4. Keep the meaning strictly faithful, only rephrase for clarity.\n\n"
+            f"Diff:\n{diff_text}\n\n"
+            "Now produce the summary as bullet points:"
+        )
+
+    @staticmethod
+    def _merge_prompt(partials: str) -> str:
+        return (
+            "You are given bullet-point summaries of consecutive parts of one diff of a web page.\n\n"
+            "Your task:\n"
+            "1. Merge them into a single list of plain human-readable bullet points.\n"
+            "2. Combine bullet points that describe the same change and remove duplicates.\n"
+            "3. Keep the meaning strictly faithful, do not add anything that is not in the summaries.\n\n"
+            f"Summaries:\n{partials}\n\n"
+            "Now produce the merged summary as bullet points:"
+        )
 
     def translate_text(self, text: str, target_language: str = "Chinese") -> str:
         prompt = (
@@ -43,23 +111,135 @@ class ChangeSummarizer:
         )
         return self._call_openai(prompt, "translation")
 
+    def translate_batch(self, texts: List[str], target_language: str = "Chinese") -> List[str]:
+        """
+        Translates several texts in one request, each introduced by a numbered
+        marker line that the reply has to repeat. If the reply cannot be split
+        back into one translation per text, each half of the batch is retried
+        the same way, down to single texts.
+
+        With a translation memory, the texts are split into sentences and only
+        the sentences not translated before are sent, in one request.
+        """
+        if self.memory is not None:
+            return self._translate_with_memory(texts, target_language)
+        return self._translate_texts(texts, target_language)
+
+    def _translate_with_memory(self, texts: List[str], target_language: str) -> List[str]:
+        split = [split_sentences(text) for text in texts]
+        translated = {}
+        missing = []
+        seen = set()
+        for pieces in split:
+            for text, translate in pieces:
+                source = normalise_sentence(text)
+                if not translate or source in seen:
+                    continue
+                seen.add(source)
+                cached = self.memory.get(cache_key(self.model, target_language, source))
+                if cached is None:
+                    missing.append(source)
+                else:
+                    translated[source] = cached
+        self.logger.info(f"Translation memory: {len(translated)} sentences known, {len(missing)} to translate")
+        if missing:
+            for source, translation in zip(missing, self._translate_texts(missing, target_language)):
+                translated[source] = translation
+                self.memory.put(cache_key(self.model, target_language, source), translation)
+        return [
+            join_sentences([(translated[normalise_sentence(text)] if translate else text, translate) for text, translate in pieces])
+            for pieces in split
+        ]
+
+    def _translate_texts(self, texts: List[str], target_language: str) -> List[str]:
+        if len(texts) == 1:
+            return [self.translate_text(texts[0], target_language)]
+        numbered = "\n".join(f"<<<{index}>>>\n{text}" for index, text in enumerate(texts, 1))
+        prompt = (
+            f"Translate each of the following {len(texts)} texts to {target_language} while strictly preserving "
+            "all original formatting including line breaks, spacing, punctuation, and special characters. "
+            "Do not modify or rearrange the structure—only translate the textual content. "
+            "Each text starts with a marker line such as <<<1>>>. Repeat every marker line unchanged before "
+            "its translation, in the same order, and add nothing else:\n\n"
+            f"{numbered}"
+        )
+        content = self._call_openai(prompt, f"batch translation of {len(texts)} texts")
+        translations = self._split_batch(content, len(texts))
+        if translations is None:
+            # Halving keeps most of the batching when one text throws the markers off.
+            half = len(texts) // 2
+            self.logger.warning(f"Could not split the batch translation of {len(texts)} texts, retrying it in two halves")
+            return self._translate_texts(texts[:half], target_language) + self._translate_texts(texts[half:], target_language)
+        return translations
+
+    @staticmethod
+    def _split_batch(content: str, count: int) -> Optional[List[str]]:
+        parts = BATCH_MARKER.split(content)
+        # ["", "1", text, "2", text, ...] when the reply is well formed.
+        if parts[0].strip() or len(parts) != 2 * count + 1:
+            return None
+        if [int(number) for number in parts[1::2]] != list(range(1, count + 1)):
+            return None
+        return [text.strip() for text in parts[2::2]]
+
     
 
     def _call_openai(self, prompt: str, operation: str) -> str:
+        key = cache_key(self.model, operation, self.SYSTEM_PROMPT, prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.logger.info(f"Using cached {operation}")
+                return cached
         try:
-            self.logger.info(f"Requesting {operation} from OpenAI...")
-            completion = self.openai_client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Be concise. Follow the user's instructions exactly."},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.0,
-                timeout=20
-            )
+            completion = self._create_completion(prompt, operation)
             content = completion.choices[0].message.content.strip()
             self.logger.info(f"Successfully completed {operation}")
+            if self.cache is not None:
+                self.cache.put(key, content)
             return content
         except Exception as e:
             self.logger.error(f"OpenAI API failed during {operation}: {str(e)}")
             raise
+
+    def _create_completion(self, prompt: str, operation: str):
+        """One chat completion, within the rate limits, retrying 429s, 5xx and connection errors with jittered backoff."""
+        # The prompt plus an allowance for the reply, settled against the real usage afterwards.
+        estimated = 2 * self.count_tokens(self.SYSTEM_PROMPT + prompt)
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(estimated)
+            try:
+                # Held for the request only, not while backing off, so a retry never blocks other callers.
+                with self.limiter.slots if self.limiter is not None else nullcontext():
+                    self.logger.info(f"Requesting {operation} from OpenAI...")
+                    completion = self.openai_client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": self.SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt},
+                        ],
+                        temperature=0.0,
+                        timeout=20
+                    )
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                retryable = status in LLM_RETRY_STATUSES or (status is None and isinstance(e, APIConnectionError))
+                if not retryable or attempt >= LLM_RETRIES:
+                    raise
+                delay = LLM_BACKOFF * (2 ** attempt) * (1 + random.random())
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                attempt += 1
+                self.logger.warning(f"Retrying {operation} in {delay:.2f}s (attempt {attempt}/{LLM_RETRIES}): {str(e) or type(e).__name__}")
+                time.sleep(delay)
+                continue
+            if self.limiter is not None and getattr(completion, "usage", None) is not None:
+                self.limiter.settle(estimated, completion.usage.total_tokens)
+            return completion
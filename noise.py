@@ -0,0 +1,188 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from parsers import Node
+
+try:
+    # Python 3.11+; sre_parse still works there but warns that it is deprecated.
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+NOISE_RULES_KEY = os.environ.get("NOISE_RULES_KEY", "noise_rules.json")
+
+# Used when no rules file can be loaded: the filters that used to run over
+# the finished diff (remove_date_lines / remove_search_lines). Like the old
+# filter, the date rule only matches a line that is nothing but a date, so a
+# date inside a sentence ("Apply by 2025-03-31") still shows up as a change.
+DEFAULT_NOISE_RULES = [
+    {"name": "date", "pattern": r"^\s*\d{4}-\d{2}-\d{2}\s*$", "action": "mask"},
+    {"name": "site_search", "pattern": r"^\s*Search (?:Canada\.ca|IRCC|CRA)\s*$", "action": "drop", "ignore_case": True},
+]
+
+
+def _closes(open_line: str, line: str) -> bool:
+    """Whether line is the end tag of the element opened by open_line, in prettified output."""
+    tag = open_line.strip()[1:].split(" ", 1)[0].rstrip(">")
+    indent = len(open_line) - len(open_line.lstrip())
+    return bool(tag) and line == f"{open_line[:indent]}</{tag}>"
+
+
+def _has_backreference(pattern: str) -> bool:
+    """Whether a pattern refers back to a group by number or name, e.g. \\1 or (?(1)...)."""
+    stack = [sre_parse.parse(pattern)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, sre_parse.SubPattern):
+            for op, value in item:
+                if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+                    return True
+                stack.append(value)
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return False
+
+
+@dataclass
+class NoiseRule:
+    """
+    A pattern for content that changes without the page really changing.
+
+    "mask" replaces each match with a placeholder before lines are compared,
+    so a line whose only change is, say, a date compares equal. "drop"
+    leaves any line containing a match out of the comparison altogether.
+    """
+    name: str
+    pattern: str
+    action: str = "mask"
+    ignore_case: bool = False
+
+    def __post_init__(self):
+        if self.action not in ("mask", "drop"):
+            raise ValueError(f"Noise rule {self.name!r}: action must be 'mask' or 'drop', not {self.action!r}")
+        if re.compile(self.pattern).groupindex:
+            raise ValueError(f"Noise rule {self.name!r}: named groups are not allowed in patterns")
+        if _has_backreference(self.pattern):
+            # Rules share one alternation, so group numbers would point at another rule's groups.
+            raise ValueError(f"Noise rule {self.name!r}: backreferences are not allowed in patterns")
+
+
+class NoiseFilter:
+    """
+    All noise rules compiled into one alternation, so each line is scanned
+    once whatever the number of rules.
+
+    Lines are compared by key: the line with masked spans replaced by
+    "[rule name]" and whitespace collapsed. Two lines with the same key are
+    treated as unchanged, and lines whose key is None are not compared.
+    """
+
+    def __init__(self, rules: Iterable[NoiseRule]):
+        self.rules = list(rules)
+        self.drop_groups = set()
+        self.placeholders = {}
+        parts = []
+        for index, rule in enumerate(self.rules):
+            group = f"rule{index}"
+            flags = "(?i:" if rule.ignore_case else "(?:"
+            parts.append(f"(?P<{group}>{flags}{rule.pattern}))")
+            self.placeholders[group] = f"[{rule.name}]"
+            if rule.action == "drop":
+                self.drop_groups.add(group)
+        self.pattern = re.compile("|".join(parts)) if parts else None
+
+    @classmethod
+    def from_config(cls, config) -> "NoiseFilter":
+        """Builds a filter from a parsed rules file: {"rules": [{"name", "pattern", "action", "ignore_case"}, ...]}."""
+        return cls(NoiseRule(**rule) for rule in config.get("rules", []))
+
+    @classmethod
+    def from_json(cls, content: Optional[str]) -> "NoiseFilter":
+        if not content:
+            return cls.from_config({"rules": DEFAULT_NOISE_RULES})
+        return cls.from_config(json.loads(content))
+
+    def key(self, line: str) -> Optional[str]:
+        """The form of a line used for comparison, or None if the line is dropped as noise."""
+        if self.pattern is None:
+            return " ".join(line.split())
+        dropped = False
+
+        def replace(match):
+            nonlocal dropped
+            if match.lastgroup in self.drop_groups:
+                dropped = True
+            return self.placeholders[match.lastgroup]
+
+        key = self.pattern.sub(replace, line)
+        return None if dropped else " ".join(key.split())
+
+    def apply(self, lines: Sequence[str]) -> Tuple[List[str], List[str]]:
+        """
+        Returns the lines that are kept and their comparison keys. An element
+        left empty because everything inside it was dropped (as in
+        prettified lines) is dropped with it.
+        """
+        kept = []
+        keys = []
+        dropped = False
+        for line in lines:
+            key = self.key(line)
+            if key is None:
+                dropped = True
+            elif dropped and kept and _closes(kept[-1], line):
+                kept.pop()
+                keys.pop()
+            else:
+                kept.append(line)
+                keys.append(key)
+                dropped = False
+        return kept, keys
+
+    def normalise_markup(self, markup: str) -> str:
+        """
+        Markup with every match masked, line by line, for the markup
+        fingerprint. Nothing is dropped: a long source line is never lost
+        because part of it matches a drop rule.
+        """
+        if self.pattern is None:
+            return markup
+        return "\n".join(
+            self.pattern.sub(lambda match: self.placeholders[match.lastgroup], line) for line in markup.split("\n")
+        )
+
+    def normalise_text(self, text: str) -> str:
+        """Text with noise masked or dropped, line by line, e.g. for fingerprinting."""
+        return "\n".join(self.apply(text.split("\n"))[1])
+
+    def filter_nodes(self, nodes: Sequence[Node]) -> List[Node]:
+        """
+        Copies a node tree with subtree hashes computed from the nodes' keys,
+        so subtrees that only differ by noise hash the same. Text and raw
+        nodes matching a drop rule are left out, and so are elements that
+        contained nothing else.
+        """
+        filtered: List[Node] = []
+        # Elements being copied: (element, remaining children, kept children so far).
+        stack = [(None, iter(nodes), filtered)]
+        while stack:
+            element, children, kept = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                if element is None or (element.children and not kept):
+                    # The top level, or an element where everything inside was noise.
+                    continue
+                # An element's start tag is masked but never dropped.
+                signature = self.key(element.open_line(0)) or ""
+                stack[-1][2].append(Node("element", element.tag, element.attrs, kept, signature=signature))
+            elif node.kind == "element":
+                stack.append((node, iter(node.children), []))
+            else:
+                keys = [self.key(line) for line in node.lines]
+                if None not in keys:
+                    kept.append(Node(node.kind, lines=node.lines, signature=f"{node.kind}\0" + "\n".join(keys)))
+        return filtered
@@ -0,0 +1,417 @@
+import hashlib
+import os
+import re
+from html import escape
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from bs4.element import PreformattedString
+from lxml import etree
+import lxml.html
+
+HTML_PARSER_BACKEND = os.environ.get("HTML_PARSER_BACKEND", "html.parser").lower()
+
+# Elements dropped from every stored snapshot.
+CLEAN_TAGS = ["script", "style", "noscript", "meta", "footer"]
+
+# Elements whose text is left out of the plain-text view used for the git diff.
+TEXT_SKIP_TAGS = {"script", "style", "footer", "header", "nav"}
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr",
+}
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+
+# Containers that are never pruned as boilerplate, whatever their class or id.
+PROTECTED_TAGS = {"html", "head", "body", "main"}
+
+
+def is_boilerplate(tag: str, class_value: str, id_value: str, skip_tags: Iterable[str], pattern: Optional[re.Pattern]) -> bool:
+    """Decides whether an element is page chrome that should be left out of the comparison."""
+    if tag in PROTECTED_TAGS:
+        return False
+    if tag in skip_tags:
+        return True
+    return bool(pattern and ((class_value and pattern.search(class_value)) or (id_value and pattern.search(id_value))))
+
+
+class Node:
+    """
+    Parser-neutral view of one DOM node, built by a parser backend.
+
+    kind is "element", "text" or "raw" (comments, doctypes and
+    whitespace-preserving elements, kept as pre-rendered lines). hash is a
+    Merkle hash over the node's signature (its tag, attributes or text) and
+    its children's hashes, so two subtrees with the same hash are identical
+    and need no further diffing.
+    """
+    __slots__ = ("kind", "tag", "attrs", "children", "lines", "signature", "hash")
+
+    def __init__(self, kind: str, tag: str = "", attrs: Sequence[Tuple[str, str]] = (), children: Optional[List["Node"]] = None, lines: Optional[List[str]] = None, signature: Optional[str] = None):
+        self.kind = kind
+        self.tag = tag
+        self.attrs = tuple(sorted(attrs))
+        self.children = children or []
+        self.lines = lines or []
+        # What the node itself is compared by, excluding its children. Noise
+        # filtering (see noise.py) substitutes a normalised form.
+        if signature is None:
+            signature = f"{kind}\0{tag}\0{self.attrs!r}\0" + "\n".join(self.lines)
+        self.signature = signature
+        digest = hashlib.blake2b(signature.encode("utf-8", "surrogatepass"), digest_size=16)
+        for child in self.children:
+            digest.update(child.hash)
+        self.hash = digest.digest()
+
+    @classmethod
+    def element(cls, tag: str, attrs: Sequence[Tuple[str, str]], children: List["Node"]) -> "Node":
+        return cls("element", tag=tag, attrs=attrs, children=children)
+
+    @classmethod
+    def text(cls, text: Optional[str]) -> Optional["Node"]:
+        """A text node, or None for whitespace-only text, which is not rendered."""
+        if not text or not text.strip():
+            return None
+        return cls("text", lines=[escape(text.strip(), quote=False)])
+
+    @classmethod
+    def raw(cls, markup: str) -> "Node":
+        return cls("raw", lines=markup.split("\n"))
+
+    @property
+    def key(self) -> str:
+        """What two nodes must share to be diffed against each other rather than replaced."""
+        return self.tag if self.kind == "element" else f"#{self.kind}"
+
+    def open_line(self, depth: int) -> str:
+        attrs = "".join(f' {name}="{escape(value)}"' for name, value in self.attrs)
+        return f"{' ' * depth}<{self.tag}{attrs}{'/' if self.tag in VOID_TAGS and not self.children else ''}>"
+
+    def close_line(self, depth: int) -> str:
+        return f"{' ' * depth}</{self.tag}>"
+
+
+def render_lines(nodes: Sequence[Node], depth: int = 0, lines: Optional[List[str]] = None) -> List[str]:
+    """One tag or text node per line, indented by depth, in the style of bs4's prettify()."""
+    if lines is None:
+        lines = []
+    stack = [(node, depth, False) for node in reversed(nodes)]
+    while stack:
+        node, level, closing = stack.pop()
+        indent = " " * level
+        if closing:
+            lines.append(node.close_line(level))
+        elif node.kind == "raw":
+            lines.append(indent + node.lines[0])
+            lines.extend(node.lines[1:])
+        elif node.kind == "text":
+            lines.append(indent + node.lines[0])
+        else:
+            lines.append(node.open_line(level))
+            if node.tag in VOID_TAGS and not node.children:
+                continue
+            stack.append((node, level, True))
+            stack.extend((child, level + 1, False) for child in reversed(node.children))
+    return lines
+
+
+# Version of the nodes_to_data format, part of the stored views' signature.
+NODES_DATA_VERSION = 2
+
+
+def nodes_to_data(nodes: Sequence[Node]) -> list:
+    """
+    Compact JSON-ready form of a node tree, flattened in document order so
+    that neither it nor its JSON encoding nests as deep as the page: text as
+    a string, raw nodes as {"raw": lines}, elements as
+    [tag, [[name, value], ...], number of children], followed by the children.
+    """
+    data = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if node.kind == "element":
+            data.append([node.tag, [list(attr) for attr in node.attrs], len(node.children)])
+            stack.extend(reversed(node.children))
+        elif node.kind == "text":
+            data.append(node.lines[0])
+        else:
+            data.append({"raw": node.lines})
+    return data
+
+
+def nodes_from_data(data: list) -> List[Node]:
+    """Rebuilds a node tree, hashes included, from nodes_to_data output."""
+    nodes: List[Node] = []
+    siblings = nodes
+    # Elements whose children are still being read: [tag, attrs, children left, parent's list].
+    stack = []
+    for item in data:
+        if isinstance(item, str):
+            node = Node("text", lines=[item])
+        elif isinstance(item, dict):
+            node = Node("raw", lines=item["raw"])
+        else:
+            tag, attrs, count = item
+            attrs = [tuple(attr) for attr in attrs]
+            if count:
+                stack.append([tag, attrs, count, siblings])
+                siblings = []
+                continue
+            node = Node.element(tag, attrs, [])
+        siblings.append(node)
+        # A node built here may complete its parent, and so on upwards.
+        while stack:
+            stack[-1][2] -= 1
+            if stack[-1][2]:
+                break
+            tag, attrs, _, parent = stack.pop()
+            parent.append(Node.element(tag, attrs, siblings))
+            siblings = parent
+    return nodes
+
+
+def _smooth(soup) -> None:
+    """
+    Merges adjacent strings throughout the tree, like bs4's Tag.smooth() but
+    without recursing once per nesting level, so deeply nested pages do not
+    hit the recursion limit.
+    """
+    for tag in [soup, *soup.find_all(True)]:
+        contents = tag.contents
+        index = len(contents) - 1
+        while index > 0:
+            a, b = contents[index - 1], contents[index]
+            if (
+                isinstance(a, NavigableString) and isinstance(b, NavigableString)
+                and not isinstance(a, PreformattedString) and not isinstance(b, PreformattedString)
+            ):
+                b.extract()
+                a.replace_with(NavigableString(a + b))
+            index -= 1
+
+
+class SoupBackend:
+    """BeautifulSoup with the pure-Python html.parser, the reference implementation."""
+    name = "html.parser"
+
+    def parse(self, html: str):
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in soup(CLEAN_TAGS):
+            tag.decompose()
+        # html.parser occasionally nests content inside void elements; re-parsing
+        # the cleaned markup would hoist it out, so do the same here.
+        for tag in soup.find_all(list(VOID_TAGS)):
+            if tag.contents:
+                for child in reversed(tag.contents):
+                    tag.insert_after(child.extract())
+        # Merge adjacent text nodes, such as those on either side of a removed
+        # tag or of a stray end tag ("<div>b</p>c</div>"), so the tree matches
+        # what re-parsing the cleaned markup would produce.
+        _smooth(soup)
+        return soup
+
+    def prune(self, soup, skip_tags: Iterable[str], pattern: Optional[re.Pattern]) -> int:
+        """Removes boilerplate subtrees in place and returns how many were removed."""
+        pruned = []
+        stack = [soup]
+        while stack:
+            node = stack.pop()
+            for child in node.children:
+                if not getattr(child, "name", None):
+                    continue
+                classes = child.get("class")
+                class_value = " ".join(classes) if isinstance(classes, list) else (classes or "")
+                if is_boilerplate(child.name, class_value, child.get("id") or "", skip_tags, pattern):
+                    pruned.append(child)
+                else:
+                    stack.append(child)
+        for tag in pruned:
+            tag.decompose()
+        if pruned:
+            _smooth(soup)
+        return len(pruned)
+
+    def markup(self, soup) -> str:
+        return str(soup)
+
+    def prettified_lines(self, soup) -> List[str]:
+        return soup.prettify().splitlines()
+
+    def nodes(self, soup) -> List[Node]:
+        nodes: List[Node] = []
+        # Elements being built: (tag, attrs, remaining contents, children so far).
+        stack = [("", [], iter(soup.contents), nodes)]
+        while stack:
+            tag, attrs, contents, children = stack[-1]
+            child = next(contents, None)
+            if child is None:
+                stack.pop()
+                if stack:
+                    stack[-1][3].append(Node.element(tag, attrs, children))
+            elif isinstance(child, Tag):
+                if child.name in PRESERVE_WHITESPACE_TAGS:
+                    children.append(Node.raw(str(child)))
+                else:
+                    child_attrs = [(name, " ".join(value) if isinstance(value, list) else value) for name, value in child.attrs.items()]
+                    stack.append((child.name, child_attrs, iter(child.contents), []))
+            elif type(child) is NavigableString:
+                node = Node.text(child)
+                if node:
+                    children.append(node)
+            elif isinstance(child, NavigableString):
+                # Comments, doctypes, CDATA and other declarations.
+                children.append(Node.raw(child.output_ready()))
+        return nodes
+
+    def text_lines(self, soup) -> List[str]:
+        body = soup.body
+        skip_tags = TEXT_SKIP_TAGS
+        if not body:
+            # Without a <body> tag html.parser leaves the content at the top
+            # level, where lxml would have put it in a <body> of its own.
+            body = soup
+            skip_tags = TEXT_SKIP_TAGS | {"head", "title"}
+        lines = []
+        stack = list(reversed(body.contents))
+        while stack:
+            node = stack.pop()
+            if type(node) in (NavigableString, CData):
+                text = node.strip()
+                if text:
+                    lines.extend(text.split("\n"))
+            elif getattr(node, "name", None) and node.name not in skip_tags:
+                stack.extend(reversed(node.contents))
+        return lines
+
+    def title(self, soup) -> Optional[str]:
+        return soup.title.string if soup.title else "No Title"
+
+    def outer_markup(self, soup, tag: str) -> List[str]:
+        return [str(element) for element in soup.find_all(tag)]
+
+
+class LxmlBackend:
+    """libxml2's HTML parser through lxml, several times faster on large pages."""
+    name = "lxml"
+
+    def parse(self, html: str):
+        try:
+            root = lxml.html.document_fromstring(html)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration.
+            root = lxml.html.document_fromstring(html.encode("utf-8"))
+        except etree.ParserError:
+            # Whitespace-only input; treat it as an empty page.
+            root = lxml.html.document_fromstring("<html></html>")
+        etree.strip_elements(root, *CLEAN_TAGS, with_tail=False)
+        return root
+
+    def prune(self, root, skip_tags: Iterable[str], pattern: Optional[re.Pattern]) -> int:
+        """Removes boilerplate subtrees in place and returns how many were removed."""
+        pruned = []
+        stack = [root]
+        while stack:
+            element = stack.pop()
+            for child in element:
+                if not isinstance(child.tag, str):
+                    continue
+                if is_boilerplate(child.tag, child.get("class") or "", child.get("id") or "", skip_tags, pattern):
+                    pruned.append(child)
+                else:
+                    stack.append(child)
+        for element in pruned:
+            element.drop_tree()
+        return len(pruned)
+
+    def markup(self, root) -> str:
+        return lxml.html.tostring(root.getroottree(), encoding="unicode")
+
+    def prettified_lines(self, root) -> List[str]:
+        return render_lines(self.nodes(root))
+
+    def nodes(self, root) -> List[Node]:
+        nodes = []
+        doctype = root.getroottree().docinfo.doctype
+        if doctype:
+            nodes.append(Node.raw(doctype))
+        nodes.append(self._node(root))
+        return nodes
+
+    def _node(self, root) -> Node:
+        if self._is_raw(root):
+            return Node.raw(lxml.html.tostring(root, encoding="unicode", with_tail=False))
+        # Elements being built: (element, remaining children, children so far).
+        stack = [(root, iter(root), [])]
+        self._add_text(root.text, stack[0][2])
+        while True:
+            element, elements, children = stack[-1]
+            child = next(elements, None)
+            if child is None:
+                stack.pop()
+                node = Node.element(element.tag, element.attrib.items(), children)
+                if not stack:
+                    return node
+                stack[-1][2].append(node)
+                self._add_text(element.tail, stack[-1][2])
+            elif self._is_raw(child):
+                children.append(Node.raw(lxml.html.tostring(child, encoding="unicode", with_tail=False)))
+                self._add_text(child.tail, children)
+            else:
+                stack.append((child, iter(child), []))
+                self._add_text(child.text, stack[-1][2])
+
+    @staticmethod
+    def _is_raw(element) -> bool:
+        return not isinstance(element.tag, str) or element.tag in PRESERVE_WHITESPACE_TAGS
+
+    @staticmethod
+    def _add_text(text: Optional[str], nodes: List[Node]) -> None:
+        node = Node.text(text)
+        if node:
+            nodes.append(node)
+
+    def text_lines(self, root) -> List[str]:
+        body = root.find("body")
+        if body is None:
+            return []
+        lines = []
+
+        def add(text):
+            text = text.strip() if text else ""
+            if text:
+                lines.extend(text.split("\n"))
+
+        stack = [(body, False)]
+        while stack:
+            element, tail_only = stack.pop()
+            if tail_only:
+                add(element.tail)
+                continue
+            add(element.text)
+            for child in reversed(element):
+                stack.append((child, True))
+                if isinstance(child.tag, str) and child.tag not in TEXT_SKIP_TAGS:
+                    stack.append((child, False))
+        return lines
+
+    def title(self, root) -> Optional[str]:
+        title = root.find(".//title")
+        if title is None:
+            return "No Title"
+        return title.text if len(title) == 0 else None
+
+    def outer_markup(self, root, tag: str) -> List[str]:
+        return [lxml.html.tostring(element, encoding="unicode", with_tail=False) for element in root.iter(tag)]
+
+
+BACKENDS = {backend.name: backend for backend in (SoupBackend(), LxmlBackend())}
+
+
+def get_backend(name: Optional[str] = None):
+    """Returns the parser backend with the given name, defaulting to HTML_PARSER_BACKEND."""
+    name = (name or HTML_PARSER_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]
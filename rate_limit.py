@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+LLM_WORKERS = int(os.environ.get("LLM_WORKERS", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "3"))
+LLM_BACKOFF = float(os.environ.get("LLM_BACKOFF", "1.0"))
+
+LLM_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used to reserve rate limit budget."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Allows up to per_minute units per minute, refilled continuously, with
+    bursts of up to a full minute's worth. A per_minute of 0 disables it.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> None:
+        """Blocks until amount units are available, then takes them."""
+        if self.capacity <= 0:
+            return
+        # A request bigger than the whole bucket would never fit; let it through on a full bucket.
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def charge(self, amount: float) -> None:
+        """Takes (or with a negative amount, returns) units without waiting, e.g. to settle an estimate."""
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """
+    Request and token budgets for the OpenAI API, shared by every thread
+    making calls, and a bound on the calls in flight at once. Threads of
+    their own, such as the parts of a long summary, wait for a slot like the
+    stage's workers do, so no more than concurrency requests are ever open.
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE, tokens_per_minute: float = LLM_TOKENS_PER_MINUTE, concurrency: int = LLM_WORKERS):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+
+    def acquire(self, tokens: int) -> None:
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+    def settle(self, estimated: int, used: int) -> None:
+        """Corrects the token budget once the real usage of a request is known."""
+        self.tokens.charge(used - estimated)
@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from storage import STORAGE_TYPE
+
+LOGS_KEY = "logs/logs.json"
+RUN_STATE_DB = os.environ.get("RUN_STATE_DB", os.path.join("logs", "run_state.sqlite3"))
+
+
+class RunState:
+    """
+    The per-link entries of logs.json ({"id", "last_updated_at", "title",
+    "url", "title_zh"}), indexed by id. Loaded once per run on first use,
+    updated in memory, and written back by commit() as a single logs.json
+    object, in the same shape and order as before, if anything changed.
+    """
+
+    def __init__(self, logger, read: Callable[[str], Optional[str]], write: Callable[[str, str], None], key: str = LOGS_KEY):
+        self.logger = logger
+        self.read = read
+        self.write = write
+        self.key = key
+        self.entries: Optional[Dict[str, Dict]] = None
+        self.dirty: Set[str] = set()
+        self.lock = threading.Lock()
+
+    def _read_logs(self) -> Dict[str, Dict]:
+        try:
+            content = self.read(self.key)
+            logs = json.loads(content) if content else []
+        except Exception as e:
+            self.logger.error(f"Failed to load {self.key}, starting from an empty log: {str(e)}")
+            logs = []
+        if not logs:
+            self.logger.warning(f"No existing logs found at {self.key}, initializing new log")
+        return {entry["id"]: entry for entry in logs}
+
+    def _load(self) -> Dict[str, Dict]:
+        if self.entries is None:
+            self.entries = self._read_logs()
+            self.logger.info(f"Loaded {len(self.entries)} log entries from {self.key}")
+        return self.entries
+
+    def get(self, id: str) -> Optional[Dict]:
+        with self.lock:
+            return self._load().get(id)
+
+    def update(self, id: str, **fields) -> None:
+        """Sets fields of the entry for id, adding it at the end if it is new."""
+        with self.lock:
+            entries = self._load()
+            entry = entries.get(id)
+            if entry is None:
+                entries[id] = dict(id=id, **fields)
+            else:
+                entry.update(fields)
+            self.dirty.add(id)
+
+    def _store(self, ids: List[str]) -> None:
+        pass
+
+    def commit(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            self._store([id for id in self.entries if id in self.dirty])
+            self.write(self.key, json.dumps(list(self.entries.values()), indent=4))
+            self.logger.info(f"Committed {len(self.dirty)} updated log entries to {self.key}")
+            self.dirty = set()
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteRunState(RunState):
+    """
+    Local mode: entries are kept in an SQLite database, updated in one
+    transaction per commit(), with logs.json written alongside for readers
+    of that file. On first use the database is filled from logs.json.
+    """
+
+    def __init__(self, logger, read: Callable[[str], Optional[str]], write: Callable[[str, str], None], key: str = LOGS_KEY, path: str = RUN_STATE_DB):
+        super().__init__(logger, read, write, key)
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def _load(self) -> Dict[str, Dict]:
+        if self.entries is not None:
+            return self.entries
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS entries (id TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+        rows = self.connection.execute("SELECT entry FROM entries ORDER BY rowid").fetchall()
+        if rows:
+            self.entries = {entry["id"]: entry for entry in (json.loads(row[0]) for row in rows)}
+            self.logger.info(f"Loaded {len(self.entries)} log entries from {self.path}")
+        else:
+            self.entries = self._read_logs()
+            self._store(list(self.entries))
+            self.logger.info(f"Imported {len(self.entries)} log entries from {self.key} into {self.path}")
+        return self.entries
+
+    def _store(self, ids: List[str]) -> None:
+        with self.connection:
+            # The upsert keeps an existing row, and so its position in logs.json.
+            self.connection.executemany(
+                "INSERT INTO entries (id, entry) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET entry = excluded.entry",
+                [(id, json.dumps(self.entries[id])) for id in ids],
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+                self.entries = None
+
+
+def get_run_state(logger, read: Callable[[str], Optional[str]], write: Callable[[str, str], None], storage_type: str = STORAGE_TYPE) -> RunState:
+    """SQLite-backed run state in local mode; a single logs.json object otherwise."""
+    if storage_type in ("s3", "memory"):
+        return RunState(logger, read, write)
+    return SQLiteRunState(logger, read, write)
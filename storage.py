@@ -0,0 +1,335 @@
+import gzip
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STORAGE_TYPE = os.environ.get("STORAGE_TYPE", "s3").lower()  # Default to s3 if not set
+S3_BUCKET = "html-differentiator"
+S3_REGION = "ca-central-1"
+# Lets the S3 backend run against a local stand-in such as moto or MinIO.
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+STORAGE_UPLOAD_WORKERS = int(os.environ.get("STORAGE_UPLOAD_WORKERS", "8"))
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
+# Compression of S3 objects: "auto" (zstd when the zstandard package is
+# installed, gzip otherwise), "gzip", "zstd" or "none".
+STORAGE_COMPRESSION = os.environ.get("STORAGE_COMPRESSION", "auto").lower()
+# The same for local files, uncompressed by default so differences/ and
+# html_runs/ open in a browser.
+LOCAL_STORAGE_COMPRESSION = os.environ.get("LOCAL_STORAGE_COMPRESSION", "none").lower()
+# Whole-page artifacts, which compress several times over and are read back every run.
+COMPRESSED_PREFIXES = tuple(
+    prefix.strip() for prefix in
+    os.environ.get("STORAGE_COMPRESSED_PREFIXES", "html_runs/,differences/,raw_diff/,html_views/").split(",")
+    if prefix.strip()
+)
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def compression_for(key: str, compression: str = STORAGE_COMPRESSION) -> Optional[str]:
+    """The encoding new content under key is stored with: "gzip", "zstd", or None for plain UTF-8."""
+    if compression == "none" or not key.startswith(COMPRESSED_PREFIXES):
+        return None
+    # zstd falls back to gzip when the zstandard package is not installed.
+    if compression in ("zstd", "auto") and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def encode(key: str, content: str, compression: str = STORAGE_COMPRESSION) -> Tuple[bytes, Optional[str]]:
+    """Content as stored under key, and its encoding."""
+    data = content.encode('utf-8')
+    encoding = compression_for(key, compression)
+    if encoding == "gzip":
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    elif encoding == "zstd":
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data, encoding
+
+
+def decode(data: bytes, encoding: Optional[str] = None, errors: str = 'strict') -> str:
+    """
+    Stored bytes back to text. Without a recorded encoding the format is
+    recognised by its magic bytes, which UTF-8 text never starts with, so
+    objects stored before compression was enabled are read as they are.
+    """
+    if encoding not in ("gzip", "zstd"):
+        if data.startswith(GZIP_MAGIC):
+            encoding = "gzip"
+        elif data.startswith(ZSTD_MAGIC):
+            encoding = "zstd"
+    if encoding == "gzip":
+        data = gzip.decompress(data)
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Stored content is zstd-compressed but the zstandard package is not installed")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data.decode('utf-8', errors=errors)
+
+
+def read_text(path: str, errors: str = 'strict') -> str:
+    """Reads a file written by LocalStorage, compressed or not."""
+    with open(path, 'rb') as f:
+        return decode(f.read(), errors=errors)
+
+
+class Storage:
+    """
+    Where every artifact of a run is kept, by key ("html_runs/<title>_<timestamp>.html").
+    list() returns dicts with "Key" and "LastModified", like S3's list_objects_v2.
+    On S3, keys under COMPRESSED_PREFIXES are stored compressed and
+    decompressed again by read(); keys do not change.
+    """
+
+    def save(self, key: str, content: str) -> None:
+        raise NotImplementedError
+
+    def read(self, key: str) -> Optional[str]:
+        """The stored content, or None if there is no such key."""
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Blocks until every save made so far is stored. Called at the end of each run."""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class LocalStorage(Storage):
+    """
+    Keys are paths relative to the working directory. Files are written as
+    plain UTF-8 unless compression is set; read() decompresses files that
+    were stored compressed either way.
+    """
+
+    def __init__(self, logger, compression: str = LOCAL_STORAGE_COMPRESSION):
+        self.logger = logger
+        self.compression = compression
+
+    def save(self, key: str, content: str) -> None:
+        full_path = os.path.join(key)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Write then rename, so a reader never sees a half-written file.
+        temp_path = f"{full_path}.tmp"
+        data, _ = encode(key, content, self.compression)
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, full_path)
+        self.logger.info(f"Successfully saved file locally: {full_path}")
+
+    def read(self, key: str) -> Optional[str]:
+        full_path = os.path.join(key)
+        if os.path.exists(full_path):
+            content = read_text(full_path)
+            self.logger.info(f"Successfully read local file: {full_path}")
+            return content
+        self.logger.warning(f"Local file not found: {full_path}")
+        return None
+
+    def list(self, prefix: str) -> List[Dict]:
+        prefix_parts = prefix.split('/')
+        dir_path = os.path.join(*prefix_parts[:-1])
+        file_prefix = prefix_parts[-1]
+
+        if not os.path.exists(dir_path):
+            self.logger.warning(f"Local directory not found: {dir_path}")
+            return []
+
+        files = []
+        for filename in os.listdir(dir_path):
+            if filename.startswith(file_prefix):
+                full_path = os.path.join(dir_path, filename)
+                files.append({
+                    'Key': os.path.join(*prefix_parts[:-1], filename),
+                    'LastModified': datetime.fromtimestamp(os.path.getmtime(full_path))
+                })
+
+        self.logger.info(f"Found {len(files)} local files matching prefix {prefix}")
+        return files
+
+    def delete(self, key: str) -> bool:
+        full_path = os.path.join(key)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+            self.logger.info(f"Successfully deleted local file: {full_path}")
+            return True
+        self.logger.warning(f"Local file not found for deletion: {full_path}")
+        return False
+
+
+class S3Storage(Storage):
+    """
+    S3 bucket over one pooled client. save() returns at once and uploads on
+    a background thread pool, so the artifacts of a link go up in parallel.
+    Until an upload has finished, reads of that key are served from memory,
+    and list() and delete() wait for pending uploads under their key or
+    prefix, so callers always see their own writes. flush() is the barrier
+    that waits for all of them.
+    """
+
+    def __init__(self, logger, client=None, bucket: str = S3_BUCKET, workers: int = STORAGE_UPLOAD_WORKERS):
+        self.logger = logger
+        self.bucket = bucket
+        self.client = client or boto3.client(
+            's3',
+            aws_access_key_id=os.environ.get("AWS_ACCESS_KEY"),
+            aws_secret_access_key=os.environ.get("AWS_SECRET_KEY"),
+            region_name=S3_REGION,
+            endpoint_url=S3_ENDPOINT_URL,
+            config=Config(
+                max_pool_connections=max(S3_MAX_POOL_CONNECTIONS, workers + 4),
+                retries={"max_attempts": 5, "mode": "adaptive"},
+                tcp_keepalive=True,
+            ),
+        )
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="s3-upload")
+        # Bounds the content held in memory while waiting for an upload thread.
+        self.slots = threading.BoundedSemaphore(self.workers * 4)
+        self.pending: Dict[str, Future] = {}
+        self.contents: Dict[str, str] = {}
+        self.failed: List[str] = []
+        self.lock = threading.Lock()
+
+    def save(self, key: str, content: str) -> None:
+        self._wait([key])
+        self.slots.acquire()
+        with self.lock:
+            self.contents[key] = content
+            try:
+                self.pending[key] = self.executor.submit(self._upload, key, content)
+            except BaseException:
+                self.contents.pop(key, None)
+                self.slots.release()
+                raise
+
+    def _upload(self, key: str, content: str) -> None:
+        try:
+            # Compressed here, on the upload thread, rather than in the caller.
+            data, encoding = encode(key, content)
+            extra = {"ContentEncoding": encoding} if encoding else {}
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **extra)
+            self.logger.info(f"Successfully saved file to S3: {key}")
+        except Exception as e:
+            self.logger.error(f"Failed to save file {key} to S3: {str(e)}")
+            with self.lock:
+                self.failed.append(key)
+            raise
+        finally:
+            with self.lock:
+                self.contents.pop(key, None)
+                self.pending.pop(key, None)
+            self.slots.release()
+
+    def _wait(self, keys: List[str]) -> None:
+        with self.lock:
+            futures = [self.pending[key] for key in keys if key in self.pending]
+        for future in futures:
+            # Failures are logged and collected by _upload; flush() reports them.
+            future.exception()
+
+    def _wait_prefix(self, prefix: str) -> None:
+        with self.lock:
+            keys = [key for key in self.pending if key.startswith(prefix)]
+        self._wait(keys)
+
+    def read(self, key: str) -> Optional[str]:
+        with self.lock:
+            if key in self.contents:
+                return self.contents[key]
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key)
+            content = decode(obj['Body'].read(), obj.get('ContentEncoding'))
+            self.logger.info(f"Successfully read file from S3: {key}")
+            return content
+        except self.client.exceptions.NoSuchKey:
+            self.logger.warning(f"S3 file not found: {key}")
+            return None
+
+    def list(self, prefix: str) -> List[Dict]:
+        self._wait_prefix(prefix)
+        contents = []
+        # list_objects_v2 returns at most 1000 keys per call.
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            contents.extend(page.get('Contents', []))
+        self.logger.info(f"Found {len(contents)} files in S3 matching prefix {prefix}")
+        return contents
+
+    def delete(self, key: str) -> bool:
+        self._wait([key])
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        self.logger.info(f"Successfully deleted file from S3: {key}")
+        return True
+
+    def flush(self) -> None:
+        with self.lock:
+            futures = list(self.pending.values())
+        for future in futures:
+            future.exception()
+        with self.lock:
+            failed, self.failed = self.failed, []
+        if failed:
+            raise IOError(f"{len(failed)} uploads to S3 failed: {', '.join(failed[:10])}")
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+class MemoryStorage(Storage):
+    """Keeps everything in a dict; for tests and benchmarks."""
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.objects: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def save(self, key: str, content: str) -> None:
+        with self.lock:
+            self.objects[key] = (content, datetime.now())
+
+    def read(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.objects.get(key)
+        return entry[0] if entry else None
+
+    def list(self, prefix: str) -> List[Dict]:
+        with self.lock:
+            return [
+                {'Key': key, 'LastModified': modified}
+                for key, (_, modified) in sorted(self.objects.items()) if key.startswith(prefix)
+            ]
+
+    def delete(self, key: str) -> bool:
+        with self.lock:
+            return self.objects.pop(key, None) is not None
+
+
+def get_storage(logger, storage_type: str = STORAGE_TYPE) -> Storage:
+    """The storage backend for STORAGE_TYPE: "s3", "local" or "memory"."""
+    if storage_type == "s3":
+        return S3Storage(logger)
+    if storage_type == "memory":
+        return MemoryStorage(logger)
+    return LocalStorage(logger)
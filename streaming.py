@@ -0,0 +1,146 @@
+import codecs
+import io
+import re
+from html import escape
+from html.parser import HTMLParser
+from typing import Callable, List, Optional
+
+from parsers import CLEAN_TAGS, VOID_TAGS
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.I)
+
+
+def _attrs_markup(attrs) -> str:
+    parts = []
+    for name, value in attrs:
+        value = "" if value is None else escape(value, quote=False).replace('"', "&quot;")
+        parts.append(f' {name}="{value}"')
+    return "".join(parts)
+
+
+class StreamingCleaner(HTMLParser):
+    """
+    Tokenizer-based equivalent of clean_html for pages fed in chunks.
+
+    script/style/noscript/meta/footer elements are dropped as they are
+    tokenized, and cleaned markup is handed to the callback as soon as it is
+    complete, so the raw page never has to be held in memory.
+    """
+
+    def __init__(self, on_markup: Callable[[str], None]):
+        super().__init__(convert_charrefs=True)
+        self.on_markup = on_markup
+        self.stack: List[str] = []
+        self.drop_depth: Optional[int] = None
+
+    @property
+    def dropping(self) -> bool:
+        return self.drop_depth is not None
+
+    def _open(self, tag: str) -> None:
+        self.stack.append(tag)
+        depth = len(self.stack) - 1
+        if tag in CLEAN_TAGS and self.drop_depth is None:
+            self.drop_depth = depth
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping or tag in CLEAN_TAGS:
+            if tag not in VOID_TAGS:
+                self._open(tag)
+            return
+        if tag in VOID_TAGS:
+            self.on_markup(f"<{tag}{_attrs_markup(attrs)}/>")
+        else:
+            self.on_markup(f"<{tag}{_attrs_markup(attrs)}>")
+            self._open(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            # Stray end tags are ignored, as the tree builder would.
+            return
+        while self.stack:
+            depth = len(self.stack) - 1
+            open_tag = self.stack.pop()
+            if self.drop_depth is None:
+                self.on_markup(f"</{open_tag}>")
+            if self.drop_depth == depth:
+                self.drop_depth = None
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.on_markup(escape(data, quote=False))
+
+    def handle_comment(self, data):
+        if not self.dropping:
+            self.on_markup(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        if not self.dropping:
+            self.on_markup(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        if not self.dropping:
+            self.on_markup(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        if not self.dropping:
+            self.on_markup(f"<![{data}]>")
+
+
+def _known_codec(charset: Optional[str]) -> bool:
+    try:
+        return bool(charset) and bool(codecs.lookup(charset))
+    except LookupError:
+        return False
+
+
+def sniff_charset(head: bytes, declared: Optional[str] = None, default: str = "utf-8") -> str:
+    """
+    Picks the charset of a page: the one declared in the Content-Type header,
+    else a <meta charset> near the start of the page, else the default.
+    """
+    if _known_codec(declared):
+        return declared
+    match = _CHARSET_RE.search(head[:2048])
+    if match:
+        charset = match.group(1).decode("ascii", "ignore")
+        if _known_codec(charset):
+            return charset
+    return default
+
+
+class StreamingPage:
+    """
+    Incrementally decodes and cleans a page from raw byte chunks.
+    Only the cleaned markup is retained; the diff stage parses it like any
+    other page, since pruning and every view it compares come from the tree.
+    """
+
+    def __init__(self, charset: Optional[str] = None):
+        self.charset = charset
+        self.decoder = None
+        self.markup = io.StringIO()
+        self.cleaner = StreamingCleaner(self.markup.write)
+
+    def feed(self, chunk: bytes) -> None:
+        if self.decoder is None:
+            charset = sniff_charset(chunk, declared=self.charset)
+            self.decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+        self.cleaner.feed(self.decoder.decode(chunk))
+
+    def close(self) -> str:
+        """Finishes parsing and returns the cleaned markup."""
+        if self.decoder is not None:
+            self.cleaner.feed(self.decoder.decode(b"", final=True))
+        self.cleaner.close()
+        markup = self.markup.getvalue()
+        self.markup.close()
+        return markup
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+SUMMARY_CACHE = os.environ.get("SUMMARY_CACHE", "1").lower() in ("1", "true", "yes")
+SUMMARY_CACHE_KEY = os.environ.get("SUMMARY_CACHE_KEY", "logs/summary_cache.json")
+SUMMARY_CACHE_MAX_BYTES = int(os.environ.get("SUMMARY_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+
+def cache_key(*parts: str) -> str:
+    """Hash of everything that determines a completion: model, operation, messages."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """
+    Completions from earlier runs, kept in a single JSON object in the
+    configured storage (read and written through the callables passed in,
+    e.g. app.read_file / app.save_file).
+
+    Entries are evicted least recently used first once their total size
+    exceeds max_bytes. The cache is loaded lazily on first use and only
+    written back by flush(), once per run, if anything changed.
+    """
+
+    def __init__(self, logger, read: Callable[[str], Optional[str]], write: Callable[[str, str], None], key: str = SUMMARY_CACHE_KEY, max_bytes: int = SUMMARY_CACHE_MAX_BYTES, name: str = "Completion cache"):
+        self.logger = logger
+        self.name = name
+        self.read = read
+        self.write = write
+        self.key = key
+        self.max_bytes = max_bytes
+        self.entries: Optional[OrderedDict] = None
+        self.size = 0
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def _load(self) -> None:
+        self.entries = OrderedDict()
+        try:
+            content = self.read(self.key)
+            if content:
+                # Stored oldest first, so insertion order is recency order.
+                for key, value in json.loads(content).items():
+                    self.entries[key] = value
+                    self.size += self._entry_size(key, value)
+                self.logger.info(f"{self.name}: loaded {len(self.entries)} entries ({self.size} bytes)")
+        except Exception as e:
+            self.logger.error(f"{self.name}: failed to load, starting empty: {str(e)}")
+            self.entries.clear()
+            self.size = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            self.dirty = True
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            if key in self.entries:
+                self.size -= self._entry_size(key, self.entries.pop(key))
+            self.entries[key] = value
+            self.size += self._entry_size(key, value)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_value = self.entries.popitem(last=False)
+                self.size -= self._entry_size(old_key, old_value)
+                self.evictions += 1
+            self.dirty = True
+
+    def flush(self) -> None:
+        """Writes the cache back to storage if it changed, and logs this run's hit rate."""
+        with self.lock:
+            total = self.hits + self.misses
+            if total:
+                self.logger.info(
+                    f"{self.name}: {self.hits} hits, {self.misses} misses ({100 * self.hits // total}% hit rate), "
+                    f"{self.evictions} evicted, {len(self.entries)} entries ({self.size} bytes)"
+                )
+            if not self.dirty:
+                return
+            try:
+                self.write(self.key, json.dumps(self.entries, ensure_ascii=False))
+                self.dirty = False
+            except Exception as e:
+                self.logger.error(f"{self.name}: failed to save: {str(e)}")
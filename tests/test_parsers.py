@@ -0,0 +1,74 @@
+import glob
+import json
+import os
+
+import pytest
+
+from conftest import FIXTURES
+from document import ParsedDocument
+from noise import NoiseFilter
+from parsers import BACKENDS, nodes_from_data, nodes_to_data
+from tree_diff import highlight_trees
+
+REFERENCE_BACKEND = "html.parser"
+PAGES = sorted(glob.glob(os.path.join(FIXTURES, "*.html")))
+
+
+def read_fixture(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+@pytest.mark.parametrize("backend", [name for name in BACKENDS if name != REFERENCE_BACKEND])
+def test_backend_matches_reference(path, backend):
+    html = read_fixture(path)
+    reference = ParsedDocument(html, backend=REFERENCE_BACKEND)
+    document = ParsedDocument(html, backend=backend)
+    assert document.text_lines == reference.text_lines
+    assert document.title == reference.title
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+@pytest.mark.parametrize("backend", list(BACKENDS))
+def test_cleaned_markup_parses_the_same(path, backend):
+    # A baseline parsed from its stored snapshot must give the same text as the page it was saved from.
+    document = ParsedDocument(read_fixture(path), backend=backend)
+    reparsed = ParsedDocument(document.cleaned_markup, backend=backend)
+    assert reparsed.text_lines == document.text_lines
+    assert reparsed.title == document.title
+
+
+def test_stray_end_tag_keeps_text_together():
+    document = ParsedDocument("<html><body><div>b</p>c</div></body></html>", backend=REFERENCE_BACKEND)
+    assert document.text_lines == ["bc"]
+
+
+def test_page_without_body_has_text():
+    document = ParsedDocument(read_fixture(os.path.join(FIXTURES, "no_body.html")), backend=REFERENCE_BACKEND)
+    assert document.title == "Fragment without a body"
+    assert "Notice" in document.text_lines
+    assert "Fragment without a body" not in document.text_lines
+
+
+def test_deeply_nested_page_parses():
+    # Deeper than the recursion limit: merging adjacent strings must not recurse per level.
+    html = "<html><body>" + "<div>x" * 3000 + "</body></html>"
+    document = ParsedDocument(html, backend=REFERENCE_BACKEND)
+    assert document.text_lines == ["x"] * 3000
+    reparsed = ParsedDocument(document.cleaned_markup, backend=REFERENCE_BACKEND)
+    assert reparsed.text_lines == document.text_lines
+    assert len(document.prettified_lines) > 3000
+
+
+def test_deep_node_tree_round_trips_and_diffs():
+    # Building, storing, filtering and diffing node trees must not recurse per level either.
+    html = "<html><body>" + "<div>" * 3000 + "{}" + "</div>" * 3000 + "</body></html>"
+    old = ParsedDocument(html.format("before"), backend=REFERENCE_BACKEND)
+    new = ParsedDocument(html.format("after"), backend=REFERENCE_BACKEND)
+    restored = nodes_from_data(json.loads(json.dumps(nodes_to_data(old.nodes))))
+    assert [node.hash for node in restored] == [node.hash for node in old.nodes]
+    noise = NoiseFilter.from_json(None)
+    _, raw_diff = highlight_trees(noise.filter_nodes(restored), noise.filter_nodes(new.nodes))
+    assert "before" in raw_diff and "after" in raw_diff
+    assert "<div>" not in raw_diff
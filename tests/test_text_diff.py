@@ -0,0 +1,96 @@
+import glob
+import os
+import shutil
+
+import pytest
+
+from conftest import FIXTURES
+from document import ParsedDocument
+from git_engine import _split_lines, generate_diff
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+# (old, new) texts whose diffs must be identical with both backends.
+CASES = {
+    "changed_line": ("a\nb\nc", "a\nB\nc"),
+    "added_lines": ("a\nc", "a\nb1\nb2\nc"),
+    "removed_lines": ("a\nb\nc\nd", "a\nd"),
+    "replaced_block": ("intro\nold one\nold two\noutro", "intro\nnew one\nnew two\nnew three\noutro"),
+    "moved_line": ("a\nb\nc\nd", "b\nc\nd\na"),
+    "repeated_lines": ("x\ny\nx\ny\nx", "x\ny\nx\nz\nx"),
+    # Changes that could be shown in more than one place among repeated lines, which git
+    # slides to line up with a change in the other text or else places by blank lines.
+    "slid_to_replace": ("l2\nl3\nl3\nl0\nl2\nl2", "l2\nl3\nl3\nn2\nl2\nn1"),
+    "slid_to_merge": ("l1\nl2\nl2\nl3\nl3\nl1\nl3\nl3", "l2\nl2\nn0\nl3\nl1\nl3\nl3\nn2"),
+    "slid_by_blank_lines": ("p\n\n\np\n\np", "p\n\n\np"),
+    "empty_old": ("", "a\nb"),
+    "empty_new": ("a\nb", ""),
+}
+
+
+def fixture_texts():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append((os.path.basename(path), ParsedDocument(f.read()).text))
+    return texts
+
+
+def edited(text):
+    """The text with a line changed, one added, one removed and one only re-spaced."""
+    lines = text.split("\n")
+    lines[0] = lines[0] + " (updated)"
+    lines.insert(len(lines) // 2, "New line added")
+    del lines[-1]
+    lines[1] = " " + lines[1].replace(" ", "\u00a0") + " "
+    return "\n".join(lines)
+
+
+@requires_git
+@pytest.mark.parametrize("old, new", CASES.values(), ids=list(CASES))
+def test_python_backend_matches_git(old, new):
+    assert generate_diff(old, new, backend="python") == generate_diff(old, new, backend="git")
+
+
+@requires_git
+@pytest.mark.parametrize("name, text", fixture_texts(), ids=[name for name, _ in fixture_texts()])
+def test_python_backend_matches_git_on_fixtures(name, text):
+    new = edited(text)
+    python_diff = generate_diff(text, new, backend="python")
+    assert python_diff
+    assert python_diff == generate_diff(text, new, backend="git")
+
+
+@pytest.mark.parametrize("backend", ["python", pytest.param("git", marks=requires_git)])
+@pytest.mark.parametrize("old, new", [
+    ("café ouvert", "cafe\u0301 ouvert"),
+    ("Non breaking space", "Non\u00a0breaking\u00a0space"),
+    ("Fee: 155", "Fee: \uff11\uff15\uff15"),
+    ("indented", "   indented   "),
+], ids=["combining_accent", "nbsp", "fullwidth_digits", "surrounding_spaces"])
+def test_pairs_equal_after_nfkc_are_dropped(backend, old, new):
+    assert generate_diff(f"a\n{old}\nz", f"a\n{new}\nz", backend=backend) == ""
+
+
+@pytest.mark.parametrize("backend", ["python", pytest.param("git", marks=requires_git)])
+def test_real_change_next_to_nfkc_pair_is_kept(backend):
+    diff = generate_diff("Non breaking space\nsame\nfee 155", "Non\u00a0breaking\u00a0space\nsame\nfee 200", backend=backend)
+    assert diff.split("\n") == ["-fee 155", "+fee 200"]
+
+
+@pytest.mark.parametrize("text, lines", [
+    ("", []),
+    ("a", ["a"]),
+    ("a\nb", ["a", "b"]),
+    ("a\nb\n", ["a", "b"]),
+    ("a\n\n", ["a", ""]),
+    ("\n", [""]),
+])
+def test_split_lines_ignores_one_trailing_newline(text, lines):
+    assert _split_lines(text) == lines
+
+
+@pytest.mark.parametrize("backend", ["python", pytest.param("git", marks=requires_git)])
+def test_trailing_newline_alone_is_not_a_change(backend):
+    assert generate_diff("a\nb", "a\nb\n", backend=backend) == ""
+    assert generate_diff("a\nb\n", "a\nb\nc\n", backend=backend) == "+c"
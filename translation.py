@@ -0,0 +1,110 @@
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import List, Tuple
+
+TRANSLATION_BATCH_SIZE = int(os.environ.get("TRANSLATION_BATCH_SIZE", "8"))
+TRANSLATION_BATCH_TOKENS = int(os.environ.get("TRANSLATION_BATCH_TOKENS", "3000"))
+TRANSLATION_MEMORY = os.environ.get("TRANSLATION_MEMORY", "1").lower() in ("1", "true", "yes")
+TRANSLATION_MEMORY_KEY = os.environ.get("TRANSLATION_MEMORY_KEY", "logs/translation_memory.json")
+TRANSLATION_MEMORY_MAX_BYTES = int(os.environ.get("TRANSLATION_MEMORY_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Leading indentation and bullet or list number, the text, trailing whitespace.
+LINE_PARTS = re.compile(r"^(\s*(?:[-*\u2022\u00b7]|\d+[.)])?\s*)(.*?)(\s*)$", re.S)
+# Whitespace after a sentence's final punctuation, when the next one starts like a sentence.
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])(\s+)(?=[A-Z\"'(])")
+# Sentence-final punctuation after which a translation needs no space.
+CJK_STOPS = "\u3002\uff01\uff1f\uff1b\uff1a"
+
+# A piece of text: (text, True) for a sentence to translate, (text, False) for formatting kept as is.
+Piece = Tuple[str, bool]
+
+
+def split_sentences(text: str) -> List[Piece]:
+    """
+    Splits text into sentences to translate and the formatting between them:
+    line breaks, indentation, bullet markers and the spaces between sentences.
+    Joining the pieces gives back the original text.
+    """
+    pieces: List[Piece] = []
+    for index, line in enumerate(text.split("\n")):
+        if index:
+            pieces.append(("\n", False))
+        prefix, body, suffix = LINE_PARTS.match(line).groups()
+        if prefix:
+            pieces.append((prefix, False))
+        if any(char.isalpha() for char in body):
+            for position, part in enumerate(SENTENCE_BREAK.split(body)):
+                # split() puts the captured whitespace at odd positions.
+                pieces.append((part, position % 2 == 0))
+        elif body:
+            pieces.append((body, False))
+        if suffix:
+            pieces.append((suffix, False))
+    return pieces
+
+
+def join_sentences(pieces: List[Piece]) -> str:
+    """Joins translated pieces, leaving out the space after a sentence that now ends in CJK punctuation."""
+    parts: List[str] = []
+    for text, translated in pieces:
+        if not translated and parts and text.strip(" ") == "" and "\n" not in text and parts[-1].endswith(tuple(CJK_STOPS)):
+            continue
+        parts.append(text)
+    return "".join(parts)
+
+
+def normalise_sentence(text: str) -> str:
+    """The form of a sentence used to look it up in the translation memory."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class TranslationBatcher:
+    """
+    Groups summaries into batch translation requests. submit() returns a
+    future for one translation; a batch is sent to the executor once it holds
+    batch_size texts or max_tokens tokens, and whatever is left is sent by
+    flush(), which callers make once no more summaries are on their way.
+    """
+
+    def __init__(self, summarizer, executor, batch_size: int = TRANSLATION_BATCH_SIZE, max_tokens: int = TRANSLATION_BATCH_TOKENS):
+        self.summarizer = summarizer
+        self.executor = executor
+        self.batch_size = max(1, batch_size)
+        self.max_tokens = max_tokens
+        self.items: List[Tuple[str, Future]] = []
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        tokens = self.summarizer.count_tokens(text)
+        with self.lock:
+            if self.items and self.tokens + tokens > self.max_tokens:
+                self._send()
+            self.items.append((text, future))
+            self.tokens += tokens
+            if len(self.items) >= self.batch_size:
+                self._send()
+        return future
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.items:
+                self._send()
+
+    def _send(self) -> None:
+        batch, self.items, self.tokens = self.items, [], 0
+        self.executor.submit(self._translate, batch)
+
+    def _translate(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            translations = self.summarizer.translate_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), translation in zip(batch, translations):
+            future.set_result(translation)
@@ -0,0 +1,79 @@
+from typing import List, Sequence, Tuple
+
+from line_diff import line_opcodes
+from parsers import VOID_TAGS, Node, render_lines
+from utils import append_changed_lines
+
+
+class _Highlighter:
+    """Collects the full highlighted page and the changed lines only."""
+
+    def __init__(self, inline_words: bool = False):
+        self.inline_words = inline_words
+        self.modified_html: List[str] = []
+        self.raw_diff: List[str] = []
+
+    def same(self, lines: List[str]) -> None:
+        self.modified_html.extend(lines)
+
+    def changed(self, removed: List[str], added: List[str]) -> None:
+        append_changed_lines(removed, added, self.modified_html, self.raw_diff, self.inline_words)
+
+
+def _diff_children(old: Sequence[Node], new: Sequence[Node], depth: int) -> List[tuple]:
+    """The steps that diff two lists of sibling nodes, in output order (see highlight_trees)."""
+    steps = []
+    for tag, i1, i2, j1, j2 in line_opcodes([node.hash for node in old], [node.hash for node in new]):
+        if tag == "equal":
+            # Identical subtrees: matched by hash, never descended into.
+            steps.append(("render", new[j1:j2], depth))
+            continue
+        # Within a changed run, pair up nodes of the same kind and tag so only
+        # the parts of them that differ get highlighted.
+        old_run, new_run = old[i1:i2], new[j1:j2]
+        for key_tag, k1, k2, l1, l2 in line_opcodes([node.key for node in old_run], [node.key for node in new_run]):
+            if key_tag == "equal":
+                steps.extend(("node", old_node, new_node, depth) for old_node, new_node in zip(old_run[k1:k2], new_run[l1:l2]))
+            else:
+                steps.append(("changed", render_lines(old_run[k1:k2], depth), render_lines(new_run[l1:l2], depth)))
+    return steps
+
+
+def _diff_node(old: Node, new: Node, depth: int) -> List[tuple]:
+    if old.hash == new.hash:
+        return [("render", [new], depth)]
+    if old.kind != "element":
+        return [("changed", render_lines([old], depth), render_lines([new], depth))]
+    if old.signature == new.signature:
+        steps = [("same", [new.open_line(depth)])]
+    else:
+        steps = [("changed", [old.open_line(depth)], [new.open_line(depth)])]
+    steps.extend(_diff_children(old.children, new.children, depth + 1))
+    if new.tag not in VOID_TAGS or new.children:
+        steps.append(("same", [new.close_line(depth)]))
+    return steps
+
+
+def highlight_trees(old_nodes: Sequence[Node], latest_nodes: Sequence[Node], inline_words: bool = False) -> Tuple[str, str]:
+    """
+    Structural counterpart of utils.highlight_lines: diffs two documents'
+    node trees, matching unchanged subtrees by hash and descending only into
+    subtrees that differ. An attribute change highlights just the element's
+    start tag instead of every line below it. Returns the full page with
+    <ins>/<del> markup and the changed lines only.
+    """
+    out = _Highlighter(inline_words)
+    # Pending steps, last one first. A pair of nodes to diff is expanded into
+    # steps only when reached, so deep trees do not recurse once per level.
+    stack = list(reversed(_diff_children(old_nodes, latest_nodes, 0)))
+    while stack:
+        step = stack.pop()
+        if step[0] == "node":
+            stack.extend(reversed(_diff_node(*step[1:])))
+        elif step[0] == "render":
+            render_lines(step[1], step[2], out.modified_html)
+        elif step[0] == "changed":
+            out.changed(step[1], step[2])
+        else:
+            out.same(step[1])
+    return "\n".join(out.modified_html), "\n".join(out.raw_diff)
@@ -1,38 +1,155 @@
+import hashlib
+from typing import List, Tuple
+
 from bs4 import BeautifulSoup
 
+from document import ParsedDocument
+from line_diff import line_opcodes
+
 def extract_ins_elements_only(html_content: str) -> str:
     """
     Extracts and returns only the <ins> elements from the given HTML content.
     Preserves the <ins> tag and its inline styles and content.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    document = ParsedDocument(html_content)
+    return "".join(document.backend.outer_markup(document.root, "ins"))
 
-    # Extract all <ins> elements
-    ins_elements = soup.find_all("ins")
 
-    # Create a new soup with only <ins> tags preserved
-    new_soup = BeautifulSoup("", "html.parser")
-    for ins in ins_elements:
-        new_soup.append(ins)
+def extract_plain_text(html_content: str) -> str:
+    """Extracts plain text from the body of an HTML string."""
+    return ParsedDocument(html_content).text
 
-    return str(new_soup)
 
+def fingerprint(content: str) -> str:
+    """Returns a stable hash of already-normalised content for cheap equality checks."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
-def extract_plain_text(html_content: str) -> str:
-    """Extracts plain text from the body of an HTML string."""
-    soup = BeautifulSoup(html_content, "html.parser")
+def clean_html(content: str) -> str:
+    """Cleans HTML content by removing scripts, styles, meta, and footer elements."""
+    if not content:
+        return None
+    return ParsedDocument(content).cleaned_markup
+
+
+def extract_body_content(html: str):
+    """Extracts the <body> of an HTML string, or the whole document if it has none."""
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.body if soup.body else soup
+
 
-    # Get only <body> content
-    body = soup.body
-    if not body:
-        return ""
+def extract_title(html: str) -> str:
+    """Extracts the title of the webpage from the HTML content."""
+    return ParsedDocument(html).title
 
-    # Remove script, style, footer, header, nav tags inside body
-    for tag in body(["script", "style", "footer", "header", "nav"]):
-        tag.decompose()
 
-    # Extract text and clean whitespace
-    text = body.get_text(separator="\n", strip=True)
-    return text
+# Paragraph pairs with more words than this are shown as a whole-paragraph
+# replacement instead of being diffed word by word.
+MAX_PARAGRAPH_WORDS = 50000
+
+DEL_WORDS = '<span style="color: red; text-decoration: line-through;">{}</span>'
+INS_WORDS = '<span style="color: green;">{}</span>'
+
+
+def _highlight_words(old_words: List[str], new_words: List[str]) -> str:
+    if max(len(old_words), len(new_words)) > MAX_PARAGRAPH_WORDS:
+        opcodes = [("replace", 0, len(old_words), 0, len(new_words))]
+    else:
+        opcodes = line_opcodes(old_words, new_words)
+    highlighted_text = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            highlighted_text.append(" ".join(new_words[j1:j2]))
+            continue
+        # Runs of removed and added words become one span each.
+        if i1 < i2:
+            highlighted_text.append(DEL_WORDS.format(" ".join(old_words[i1:i2])))
+        if j1 < j2:
+            highlighted_text.append(INS_WORDS.format(" ".join(new_words[j1:j2])))
+    return " ".join(highlighted_text)
+
+
+def highlight_text_diff(text1: str, text2: str) -> str:
+    """
+    Generates highlighted HTML diff for inline text changes.
+
+    Paragraphs (lines) are aligned first and only changed paragraphs are
+    diffed word by word, so the cost depends on the size of the changed
+    paragraphs rather than the whole text. Unchanged paragraphs are kept
+    as-is, one per output line.
+    """
+    old_paragraphs = text1.split("\n")
+    new_paragraphs = text2.split("\n")
+    highlighted = []
+    for tag, i1, i2, j1, j2 in line_opcodes(old_paragraphs, new_paragraphs):
+        if tag == "equal":
+            highlighted.extend(new_paragraphs[j1:j2])
+            continue
+        for offset in range(max(i2 - i1, j2 - j1)):
+            old_words = old_paragraphs[i1 + offset].split() if i1 + offset < i2 else []
+            new_words = new_paragraphs[j1 + offset].split() if j1 + offset < j2 else []
+            highlighted.append(_highlight_words(old_words, new_words))
+    return "\n".join(highlighted)
 
+
+def highlight_differences(old_html: str, latest_html: str) -> Tuple[str, str]:
+    """
+    Highlights differences between two HTML documents.
+    Returns the full page with <ins>/<del> markup and the changed lines only.
+    """
+    return highlight_lines(ParsedDocument(old_html).prettified_lines, ParsedDocument(latest_html).prettified_lines)
+
+
+def highlight_lines(old_lines: List[str], latest_lines: List[str], inline_words: bool = False, noise=None) -> Tuple[str, str]:
+    """
+    Highlights differences between the prettified lines of two parsed documents.
+    Within a changed block, removed and added lines are paired up so each
+    <del> line is directly followed by its replacement <ins> line.
+
+    With a noise.NoiseFilter, lines are compared by their noise-masked keys
+    and lines matching a drop rule are left out, so noise never shows up
+    as a change.
+    """
+    if noise is not None:
+        old_lines, old_keys = noise.apply(old_lines)
+        latest_lines, latest_keys = noise.apply(latest_lines)
+    else:
+        old_keys, latest_keys = old_lines, latest_lines
+    modified_html = []
+    raw_diff = []
+    for tag, i1, i2, j1, j2 in line_opcodes(old_keys, latest_keys):
+        if tag == "equal":
+            modified_html.extend(latest_lines[j1:j2])
+        else:
+            append_changed_lines(old_lines[i1:i2], latest_lines[j1:j2], modified_html, raw_diff, inline_words)
+
+    return "\n".join(modified_html), "\n".join(raw_diff)
+
+
+def _is_text_line(line: str) -> bool:
+    # Prettified text is escaped, so only tags and comments start with "<".
+    return bool(line.strip()) and not line.lstrip().startswith("<")
+
+
+def append_changed_lines(removed: List[str], added: List[str], modified_html: List[str], raw_diff: List[str], inline_words: bool = False) -> None:
+    """
+    Appends one changed block to the highlighted page and to the raw diff,
+    pairing each removed line with the added line at the same position.
+
+    With inline_words, a pair of changed text lines is shown in the page as
+    a single line with word-level highlighting (see highlight_text_diff);
+    the raw diff always keeps the <del>/<ins> pair.
+    """
+    for offset in range(max(len(removed), len(added))):
+        pair = []
+        if offset < len(removed):
+            pair.append(f'<del style="background-color: lightcoral;">{removed[offset]}</del>')
+        if offset < len(added):
+            pair.append(f'<ins style="background-color: lightgreen;">{added[offset]}</ins>')
+        raw_diff.extend(pair)
+        if inline_words and len(pair) == 2 and _is_text_line(removed[offset]) and _is_text_line(added[offset]):
+            new_line = added[offset]
+            indent = new_line[:len(new_line) - len(new_line.lstrip())]
+            modified_html.append(indent + highlight_text_diff(removed[offset].strip(), new_line.strip()))
+        else:
+            modified_html.extend(pair)